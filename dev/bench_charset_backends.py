@@ -0,0 +1,104 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Speed and accuracy of the installed compat charset detector backends
+# over a corpus of texts in legacy encodings. A sample counts as correct
+# when the detected encoding decodes it back to the original text.
+import time
+
+from dsdev_utils.compat import CHARSET_BACKENDS, available_charset_backends
+
+TEXTS = {
+    "english": "The quick brown fox jumps over the lazy dog. It's 20°C "
+               "outside and the café sells crème brûlée for £5. ",
+    "french": "Le coeur a ses raisons que la raison ne connaît point. "
+              "À bientôt, ça coûte très cher à l'hôtel. ",
+    "german": "Zwölf Boxkämpfer jagen Viktor quer über den großen Sylter "
+              "Deich. Grüße aus München. ",
+    "polish": "Zażółć gęślą jaźń. Pchnąć w tę łódź jeża lub ośm skrzyń "
+              "fig. Źródło wiedzy. ",
+    "russian": "Съешь же ещё этих мягких французских булок, да выпей чаю. "
+               "Широкая электрификация южных губерний. ",
+    "greek": "Γαζέες και μυρτιές δεν θα βρω πια στο χρυσαφί ξέφωτο. "
+             "Ξεσκεπάζω την ψυχοφθόρα βδελυγμία. ",
+    "japanese": "いろはにほへと ちりぬるを わかよたれそ つねならむ。"
+                "今日は良い天気ですね。日本語の文章です。",
+    "chinese": "我能吞下玻璃而不伤身体。天地玄黄，宇宙洪荒。"
+               "这是一个中文句子，用于测试编码检测。",
+    "chinese-traditional": "我能吞下玻璃而不傷身體。天地玄黃，宇宙洪荒。"
+                           "這是一個中文句子，用於測試編碼檢測。",
+    "korean": "다람쥐 헌 쳇바퀴에 타고파. 키스의 고유조건은 입술끼리 "
+              "만나야 하고 특별한 기술은 필요치 않다. ",
+}
+
+CORPUS = [
+    ("english", "cp1252"),
+    ("french", "cp1252"),
+    ("french", "iso-8859-1"),
+    ("german", "cp1252"),
+    ("polish", "cp1250"),
+    ("polish", "iso-8859-2"),
+    ("russian", "cp1251"),
+    ("russian", "koi8-r"),
+    ("greek", "iso-8859-7"),
+    ("greek", "cp1253"),
+    ("japanese", "shift_jis"),
+    ("japanese", "euc-jp"),
+    ("chinese", "gb2312"),
+    ("chinese-traditional", "big5"),
+    ("korean", "euc-kr"),
+]
+SIZES = (256, 4096, 65536)
+
+
+def correct(data, text, encoding):
+    try:
+        return encoding is not None and data.decode(encoding) == text
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+def main():
+    samples = []
+    for language, encoding in CORPUS:
+        base = TEXTS[language]
+        for size in SIZES:
+            text = base * (size // len(base.encode(encoding)) + 1)
+            samples.append((text, text.encode(encoding)))
+
+    print("{:<20} {:>10} {:>12}".format("backend", "accuracy", "total (s)"))
+    for name in available_charset_backends():
+        backend = CHARSET_BACKENDS[name]
+        backend.detect(b"warm up")
+        hits = 0
+        start = time.perf_counter()
+        results = [backend.detect(data) for _, data in samples]
+        elapsed = time.perf_counter() - start
+        for (text, data), encoding in zip(samples, results):
+            hits += correct(data, text, encoding)
+        print("{:<20} {:>9.0%} {:>12.3f}".format(
+            name, hits / len(samples), elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Times compat.detect_and_decode against running chardet on the whole
+# input, across input sizes and encodings.
+import codecs
+import time
+
+import chardet
+
+from dsdev_utils.compat import detect_and_decode
+
+SAMPLES = {
+    "ascii": ("Give me some bytes. ", "ascii", b""),
+    "utf-8": ("Grüße aus München, 世界. ", "utf-8", b""),
+    "utf-16 bom": ("Grüße aus München. ", "utf-16-le", codecs.BOM_UTF16_LE),
+    "cp1252": ("Le café est très bon. ", "cp1252", b""),
+    "shift_jis": ("こんにちは、世界。", "shift_jis", b""),
+}
+SIZES = (1024, 100 * 1024, 1024 * 1024)
+
+
+def full_chardet(data):
+    enc = chardet.detect(data)
+    return data.decode(enc["encoding"])
+
+
+def timed(func, data, limit=0.5):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func(data)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed > limit:
+            return elapsed / count
+
+
+def main():
+    print("{:<12} {:>9} {:>14} {:>14}  {}".format(
+        "encoding", "size", "chardet (ms)", "tiered (ms)", "tier"))
+    for name, (text, encoding, bom) in SAMPLES.items():
+        for size in SIZES:
+            data = bom + (text * (size // len(text) + 1)).encode(encoding)
+            data = data[:size - size % 4]
+            tier = detect_and_decode(data).tier
+            print("{:<12} {:>9} {:>14.3f} {:>14.3f}  {}".format(
+                name, len(data),
+                timed(full_chardet, data) * 1000,
+                timed(detect_and_decode, data) * 1000,
+                tier))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Configs built per second with ConfigDict.from_object, against the
+# previous dir() based implementation, and attribute reads from a
+# ConfigDict against a frozen snapshot.
+import sys
+import time
+import timeit
+
+from dsdev_utils.config import ConfigDict
+
+
+class BaseConfig(object):
+    APP_NAME = "app"
+    COMPANY_NAME = "acme"
+    UPDATE_URLS = ["https://example.com"]
+    MAX_DOWNLOAD_RETRIES = 3
+
+    def helper(self):
+        pass
+
+
+class TenantConfig(BaseConfig):
+    locals().update({"SETTING_{}".format(i): i for i in range(30)})
+    lower_case = "ignored"
+
+
+def old_from_object(config, obj):
+    for key in dir(obj):
+        if key.isupper():
+            config[key] = getattr(obj, key)
+
+
+def bench(label, build, seconds=1.0):
+    count = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for _ in range(1000):
+            build()
+        count += 1000
+    print("{:<24} {:>10.0f} configs/s".format(label, count / seconds))
+
+
+def main():
+    tenant = TenantConfig()
+    assert ConfigDict() == ConfigDict()
+
+    def old():
+        old_from_object(ConfigDict(), tenant)
+
+    def new():
+        ConfigDict().from_object(tenant)
+
+    bench("dir() from_object", old)
+    bench("cached from_object", new)
+
+    config = ConfigDict()
+    config.from_object(tenant)
+    frozen = config.freeze()
+    number = 2000000
+    for label, obj in (("ConfigDict", config), ("FrozenConfig", frozen)):
+        best = min(timeit.repeat(
+            "c.APP_NAME", globals={"c": obj}, number=number, repeat=5))
+        print("{:<24} {:>6.1f} ns/read {:>6} bytes".format(
+            label, best / number * 1e9, sys.getsizeof(obj)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# Copies a tree of a few large and many small files with
+# shutil.copytree and with paths.copy_tree. Pass a directory on the
+# volume to test, e.g. a Btrfs or XFS mount for reflinks, as the first
+# argument.
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from dsdev_utils.paths import copy_file, copy_tree
+
+
+def make_tree(root, big=4, small=2000):
+    os.makedirs(os.path.join(root, "lib"))
+    chunk = os.urandom(1024 * 1024)
+    for i in range(big):
+        with open(os.path.join(root, "big{}".format(i)), "wb") as f:
+            for _ in range(64):
+                f.write(chunk)
+    for i in range(small):
+        with open(os.path.join(root, "lib", "f{}".format(i)), "wb") as f:
+            f.write(chunk[:4096])
+
+
+def main():
+    base = tempfile.mkdtemp(dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    try:
+        src = os.path.join(base, "src")
+        make_tree(src)
+        method = copy_file(os.path.join(src, "big0"), os.path.join(base, "x"))
+        print("copy_file method:", method)
+        for label, copy in (
+            ("shutil.copytree", shutil.copytree),
+            ("copy_tree(1)", lambda s, d: copy_tree(s, d, workers=1)),
+            ("copy_tree(8)", lambda s, d: copy_tree(s, d, workers=8)),
+        ):
+            dst = os.path.join(base, "dst")
+            # Keep writeback of the previous copy out of the timing
+            os.sync()
+            start = time.perf_counter()
+            copy(src, dst)
+            print("{:<16} {:8.3f}s".format(label, time.perf_counter() - start))
+            shutil.rmtree(dst)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# Finds duplicates in a tree of mixed size files by hashing every file
+# with crypto.get_package_hashes and with paths.find_duplicates. Pass a
+# directory on the volume to test as the first argument.
+import collections
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from dsdev_utils.crypto import get_package_hashes
+from dsdev_utils.paths import find_duplicates
+
+
+def make_tree(root, files=2000, dupes=200):
+    rand = random.Random(0)
+    chunk = os.urandom(1024 * 1024 * 4)
+    written = []
+    for i in range(files):
+        sub = os.path.join(root, "d{}".format(i % 20))
+        os.makedirs(sub, exist_ok=True)
+        path = os.path.join(sub, "f{}".format(i))
+        if i < dupes:
+            data = chunk[: rand.randrange(1, len(chunk))]
+            written.append(data)
+        elif i < dupes * 2:
+            data = written[i - dupes]
+        else:
+            start = rand.randrange(len(chunk) // 2)
+            data = chunk[start:start + rand.randrange(1, len(chunk) // 2)]
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def hash_all(root):
+    by_hash = collections.defaultdict(list)
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            by_hash[get_package_hashes(path)].append(path)
+    return [group for group in by_hash.values() if len(group) > 1]
+
+
+def main():
+    base = tempfile.mkdtemp(dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    try:
+        root = os.path.join(base, "tree")
+        make_tree(root)
+        for label, find in (
+            ("hash every file", hash_all),
+            ("find_duplicates", lambda p: find_duplicates([p])),
+        ):
+            start = time.perf_counter()
+            groups = find(root)
+            print("{:<16} {:8.3f}s {} groups".format(
+                label, time.perf_counter() - start, len(groups)))
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Compares attribute access through a loaded helpers.lazy_import proxy
+# with a plain module attribute.
+import timeit
+
+from dsdev_utils.helpers import _LazyImport
+
+
+def load_os():
+    import os
+    return os
+
+
+def main():
+    import os
+    proxy = _LazyImport("os", load_os)
+    proxy.sep  # load it
+    number = 5000000
+    for label, stmt, env in (
+        ("module attribute", "os.sep", {"os": os}),
+        ("lazy_import proxy", "proxy.sep", {"proxy": proxy}),
+    ):
+        best = min(timeit.repeat(stmt, globals=env, number=number, repeat=5))
+        print("{:<20} {:6.1f} ns".format(label, best / number * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Compares loading a manifest with json against dsdev_utils.manifest,
+# both in full and for a single subtree.
+import json
+import time
+
+from dsdev_utils.manifest import loads_manifest, dumps_manifest
+
+from bench_merge import make_manifest
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    print("{:<20} {:8.4f}s".format(label, time.perf_counter() - start))
+
+
+def main():
+    manifest = make_manifest(100, 50, 100, "mac")
+    json_data = json.dumps(manifest)
+    bin_data = dumps_manifest(manifest)
+    print("json size {}, binary size {}".format(len(json_data), len(bin_data)))
+    timed("json.loads", json.loads, json_data)
+    timed("loads_manifest", loads_manifest, bin_data)
+    timed("loads_manifest key", loads_manifest, bin_data, key="updates*app42")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Benchmarks helpers.merge_dicts against a copying recursive merge on a
+# manifest with 1M leaves.
+import copy
+import time
+
+from dsdev_utils.helpers import merge_dicts
+
+
+def make_manifest(apps, platforms, versions, tag):
+    return {
+        "updates": {
+            "app{}".format(a): {
+                "{}{}".format(tag, p): {
+                    "1.{}.0".format(v): {"file_hash": "x" * 8}
+                    for v in range(versions)
+                }
+                for p in range(platforms)
+            }
+            for a in range(apps)
+        }
+    }
+
+
+def copy_merge(left, right):
+    merged = copy.deepcopy(left)
+    for k, v in right.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = copy_merge(merged[k], v)
+        else:
+            merged[k] = copy.deepcopy(v)
+    return merged
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    print("{:<12} {:8.3f}s".format(label, time.perf_counter() - start))
+
+
+def main():
+    # 100 apps * 50 platforms * 100 versions per side = 1M leaves total
+    left = make_manifest(100, 50, 100, "mac")
+    right = make_manifest(100, 50, 100, "win")
+    timed("copy_merge", copy_merge, left, right)
+    timed("merge_dicts", merge_dicts, left, right)
+
+
+if __name__ == "__main__":
+    main()
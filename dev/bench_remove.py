@@ -0,0 +1,65 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+# Removes a tree of many small files with shutil.rmtree and with
+# paths.remove_tree. Pass a directory on the volume to test, e.g. a
+# network mount, as the first argument.
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from dsdev_utils.paths import remove_tree
+
+
+def make_tree(root, dirs=20, files=50, depth=2):
+    os.makedirs(root)
+    for i in range(files):
+        with open(os.path.join(root, "f{}".format(i)), "wb") as f:
+            f.write(b"x" * 512)
+    if depth:
+        for i in range(dirs):
+            make_tree(os.path.join(root, "d{}".format(i)), dirs, files, depth - 1)
+
+
+def main():
+    base = tempfile.mkdtemp(dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    try:
+        for label, remove in (
+            ("shutil.rmtree", shutil.rmtree),
+            ("remove_tree(8)", lambda p: remove_tree(p, workers=8)),
+            ("remove_tree(32)", lambda p: remove_tree(p, workers=32)),
+        ):
+            root = os.path.join(base, "tree")
+            make_tree(root)
+            start = time.perf_counter()
+            result = remove(root)
+            print("{:<16} {:8.3f}s {}".format(
+                label, time.perf_counter() - start, result or ""))
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# Sizes a tree of many small files with os.walk + os.lstat and with
+# paths.scan_tree, cold and with a warm cache. Pass a directory on the
+# volume to test as the first argument.
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from dsdev_utils.paths import scan_tree
+
+
+def make_tree(root, dirs=20, files=50, depth=2):
+    os.makedirs(root)
+    for i in range(files):
+        with open(os.path.join(root, "f{}".format(i)), "wb") as f:
+            f.write(b"x" * 512)
+    if depth:
+        for i in range(dirs):
+            make_tree(os.path.join(root, "d{}".format(i)), dirs, files, depth - 1)
+
+
+def walk_size(root):
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            total += os.lstat(os.path.join(dirpath, name)).st_size
+    return total
+
+
+def main():
+    base = tempfile.mkdtemp(dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    try:
+        root = os.path.join(base, "tree")
+        make_tree(root)
+        cache = {}
+        scan_tree(root, cache=cache)
+        for label, scan in (
+            ("os.walk+lstat", walk_size),
+            ("scan_tree", scan_tree),
+            ("scan_tree(8)", lambda p: scan_tree(p, workers=8)),
+            ("scan_tree cached", lambda p: scan_tree(p, cache=cache)),
+        ):
+            start = time.perf_counter()
+            result = scan(root)
+            print("{:<18} {:8.3f}s {}".format(
+                label, time.perf_counter() - start, result))
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,10 +21,118 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
-from ._version import get_versions
+# Submodules and their main attributes are imported on first access
+# (PEP 562) so a tool that only needs paths.remove_any doesn't pay for
+# chardet, packaging, deprecated or flask.
+_SUBMODULES = frozenset([
+    "app",
+    "compat",
+    "config",
+    "crypto",
+    "exceptions",
+    "flask",
+    "helpers",
+    "logger",
+    "manifest",
+    "paths",
+    "system",
+    "terminal",
+])
 
-__version__ = get_versions()["version"]
-del get_versions
+_ATTRIBUTES = {
+    "FROZEN": "app",
+    "app_cwd": "app",
+    "available_charset_backends": "compat",
+    "decode_batch": "compat",
+    "detect_and_decode": "compat",
+    "get_charset_backend": "compat",
+    "iter_decode": "compat",
+    "make_compat_str": "compat",
+    "set_charset_backend": "compat",
+    "AcyclicConfigDict": "config",
+    "ConfigDict": "config",
+    "ConfigFile": "config",
+    "FrozenConfig": "config",
+    "LayeredConfig": "config",
+    "get_package_hashes": "crypto",
+    "get_partial_hash": "crypto",
+    "STDError": "exceptions",
+    "DSFlaskResponse": "flask",
+    "EasyAccessDict": "helpers",
+    "Version": "helpers",
+    "format_lazy_import_report": "helpers",
+    "gzip_decompress": "helpers",
+    "lazy_import": "helpers",
+    "lazy_attr": "helpers",
+    "lazy_import_report": "helpers",
+    "lazy_module": "helpers",
+    "merge_dicts": "helpers",
+    "prefetch_lazy_imports": "helpers",
+    "logging_formatter": "logger",
+    "dump_manifest": "manifest",
+    "dumps_manifest": "manifest",
+    "load_manifest": "manifest",
+    "loads_manifest": "manifest",
+    "AtomicWriteBatch": "paths",
+    "ChDir": "paths",
+    "CopyStats": "paths",
+    "DuplicateFile": "paths",
+    "DirStats": "paths",
+    "RemoveStats": "paths",
+    "WorkDir": "paths",
+    "atomic_write": "paths",
+    "copy_file": "paths",
+    "copy_tree": "paths",
+    "cwd_open": "paths",
+    "cwd_run": "paths",
+    "cwd_scandir": "paths",
+    "empty_trash": "paths",
+    "find_duplicates": "paths",
+    "get_cwd": "paths",
+    "get_mac_dot_app_dir": "paths",
+    "link_duplicates": "paths",
+    "remove_any": "paths",
+    "remove_later": "paths",
+    "remove_tree": "paths",
+    "replace_dir": "paths",
+    "resolve_path": "paths",
+    "scan_tree": "paths",
+    "swap_dirs": "paths",
+    "get_architecure": "system",
+    "get_system": "system",
+    "ask_yes_no": "terminal",
+    "get_correct_answer": "terminal",
+    "get_terminal_size": "terminal",
+    "print_to_console": "terminal",
+    "terminal_formatter": "terminal",
+}
 
-from . import _version
-__version__ = _version.get_versions()['version']
+
+def _import_submodule(name):
+    # Plain __import__ so the import shows up in python -X importtime
+    return __import__(__name__ + "." + name, fromlist=[name])
+
+
+def __getattr__(name):
+    if name == "__version__":
+        # In a source checkout versioneer runs git to work out the
+        # version, so only do it when asked and only once. Built
+        # packages get a static _version.py from versioneer's cmdclass.
+        from ._version import get_versions
+        version = get_versions()["version"]
+        globals()["__version__"] = version
+        return version
+    if name in _SUBMODULES:
+        return _import_submodule(name)
+    if name in _ATTRIBUTES:
+        module = _import_submodule(_ATTRIBUTES[name])
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    names = set(globals()) | _SUBMODULES | set(_ATTRIBUTES)
+    names.add("__version__")
+    return sorted(names)
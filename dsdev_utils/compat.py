@@ -21,28 +21,513 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
-import chardet
+import codecs
+import collections
+import concurrent.futures
+import importlib
+import importlib.util
 import logging
+import os
 
 log = logging.getLogger(__name__)
 
+# Bytes given to the charset detector when the cheaper tiers can't decide
+DETECT_SAMPLE_SIZE = 64 * 1024
+
+# Which tier of detect_and_decode picked the encoding. The chardet tiers
+# use whichever charset detector backend is selected.
+TIER_BOM = "bom"
+TIER_UTF8 = "utf-8"
+TIER_CHARDET = "chardet"
+TIER_CHARDET_FULL = "chardet-full"
+
+# Set to a backend name to override the automatic choice
+CHARSET_BACKEND_ENV = "DSDEV_CHARSET_BACKEND"
+
+# (bom, reported encoding, codec for the data after the bom). UTF-32
+# first since its little endian BOM starts with the UTF-16 one.
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "UTF-32LE", "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "UTF-32BE", "utf-32-be"),
+    (codecs.BOM_UTF8, "UTF-8-SIG", "utf-8"),
+    (codecs.BOM_UTF16_LE, "UTF-16LE", "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "UTF-16BE", "utf-16-be"),
+)
+_MAX_BOM_SIZE = 4
+
+DecodeResult = collections.namedtuple("DecodeResult", "text encoding tier")
+
+# decode_batch only starts a process pool for at least this many detections
+_MIN_POOL_JOBS = 32
+
+
+class CharsetBackend(object):
+    """Charset detector backed by a chardet compatible module.
+
+    Args:
+
+        name (str): Backend name
+
+        module (str): Module providing detect()
+
+    Kwargs:
+
+        incremental (bool): Module provides a chardet style
+                            UniversalDetector
+    """
+
+    def __init__(self, name, module, incremental=True):
+        self.name = name
+        self.module = module
+        self.incremental = incremental
+        self._available = None
+        self._module = None
+
+    def available(self):
+        """Returns True if the module is installed. Looking for it walks
+        sys.path, so the answer is cached until set_charset_backend is
+        called."""
+        if self._available is None:
+            self._available = importlib.util.find_spec(self.module) is not None
+        return self._available
+
+    def detect(self, data):
+        """Returns the detected encoding of data or None"""
+        return self._load().detect(data)["encoding"]
+
+    def universal_detector(self):
+        """Returns a UniversalDetector or None if there isn't one"""
+        if self.incremental is False:
+            return None
+        return self._load().UniversalDetector()
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.module)
+        return self._module
+
+    def __repr__(self):
+        return "CharsetBackend({!r})".format(self.name)
+
+
+# Fastest first, going by dev/bench_charset_backends.py
+CHARSET_BACKENDS = collections.OrderedDict((b.name, b) for b in (
+    CharsetBackend("cchardet", "cchardet"),
+    CharsetBackend("charset_normalizer", "charset_normalizer", incremental=False),
+    CharsetBackend("chardet", "chardet"),
+))
+
+_charset_backend = None
+# Fastest installed backend, found on first use
+_auto_charset_backend = None
+
+
+def available_charset_backends():
+    """Returns names of the installed backends, fastest first"""
+    return [name for name, b in CHARSET_BACKENDS.items() if b.available()]
+
+
+def set_charset_backend(name):
+    """Sets the backend used when none is passed explicitly.
+
+    Clears the cached backend availability, so backends installed
+    since are picked up.
+
+    Args:
+
+        name (str): Backend name or None to go back to automatic choice
+    """
+    global _charset_backend, _auto_charset_backend
+    for backend in CHARSET_BACKENDS.values():
+        backend._available = None
+    _auto_charset_backend = None
+    _charset_backend = None if name is None else get_charset_backend(name)
+
+
+def get_charset_backend(name=None):
+    """Returns a charset detector backend.
+
+    Kwargs:
+
+        name (str): Backend name. If None the backend from
+                    set_charset_backend, the DSDEV_CHARSET_BACKEND
+                    environment variable or the fastest installed one
+                    is used, in that order.
+
+    Returns:
+
+        (CharsetBackend): The backend
+    """
+    if name is None:
+        if _charset_backend is not None:
+            return _charset_backend
+        name = os.environ.get(CHARSET_BACKEND_ENV)
+    if name is None:
+        return _auto_backend()
+    try:
+        backend = CHARSET_BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown charset backend: {}".format(name))
+    if not backend.available():
+        raise ImportError("Charset backend {} isn't installed".format(name))
+    return backend
+
+
+def _auto_backend():
+    global _auto_charset_backend
+    if _auto_charset_backend is None:
+        for backend in CHARSET_BACKENDS.values():
+            if backend.available():
+                _auto_charset_backend = backend
+                break
+        else:
+            raise ImportError("No charset detector installed")
+    return _auto_charset_backend
+
 
 def make_compat_str(in_str):
     """
     Tries to guess encoding of [str/bytes] and decode it into
     an unicode object.
     """
-    # Detect the encoding now
-    enc = chardet.detect(in_str)
+    return detect_and_decode(in_str).text
+
+
+def detect_and_decode(in_str, sample_size=DETECT_SAMPLE_SIZE, backend=None):
+    """Decodes bytes of unknown encoding, cheapest check first.
+
+    1. A byte order mark decides the encoding and is stripped
+    2. Data that decodes as strict UTF-8 (ASCII included) is used as is
+    3. The charset detector looks at the first sample_size bytes. If
+       the whole input doesn't decode with its guess, the detector runs
+       on all of it.
+
+    Args:
+
+        in_str (bytes): Data to decode
+
+    Kwargs:
+
+        sample_size (int): Bytes passed to the detector in tier 3
+
+        backend (str): Charset detector backend, see get_charset_backend
+
+    Returns:
+
+        (DecodeResult): text, encoding and the tier that decided
+    """
+    for bom, encoding, codec in _BOMS:
+        if in_str.startswith(bom):
+            text = codecs.decode(in_str[len(bom):], codec)
+            return DecodeResult(text, encoding, TIER_BOM)
+
+    try:
+        text = in_str.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    else:
+        encoding = "ascii" if in_str.isascii() else "utf-8"
+        return DecodeResult(text, encoding, TIER_UTF8)
+
+    detector = get_charset_backend(backend)
+    tier = TIER_CHARDET
+    encoding = detector.detect(in_str[:sample_size])
+    try:
+        text = in_str.decode(encoding)
+    except (UnicodeDecodeError, TypeError, LookupError):
+        if len(in_str) <= sample_size:
+            raise
+        tier = TIER_CHARDET_FULL
+        encoding = detector.detect(in_str)
+        text = in_str.decode(encoding)
+
+    # Cleanup: Sometimes UTF-16 strings include the BOM
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    return DecodeResult(text, encoding, tier)
+
+
+def decode_batch(payloads, sources=None, processes=None, encoding_cache=None,
+                 sample_size=DETECT_SAMPLE_SIZE, backend=None):
+    """Decodes many byte strings of unknown encoding.
+
+    BOM and UTF-8 payloads are handled right away. Of the rest, payloads
+    with the same source are assumed to share an encoding, so it's
+    detected once per source from a sample of its payloads. Payloads
+    without a source are detected one by one. Detection runs in a
+    process pool since the pure Python detectors hold the GIL. Payloads
+    that don't decode with their source's encoding are detected on
+    their own.
+
+    Args:
+
+        payloads (list): bytes to decode
+
+    Kwargs:
+
+        sources (list): Source key for each payload, None for unknown
+
+        processes (int): Pool size. None uses os.cpu_count(), 1 detects
+                         in this process.
+
+        encoding_cache (dict): Source key to encoding. Checked before
+                               detecting and updated with new results,
+                               pass the same dict to reuse it across
+                               batches.
+
+        sample_size (int): Bytes passed to the detector per source
+
+        backend (str): Charset detector backend, see get_charset_backend
+
+    Returns:
+
+        (list): Decoded strings in the same order as payloads
+    """
+    payloads = list(payloads)
+    if sources is None:
+        sources = [None] * len(payloads)
+    else:
+        sources = list(sources)
+        if len(sources) != len(payloads):
+            raise ValueError("sources and payloads differ in length")
+    if encoding_cache is None:
+        encoding_cache = {}
+
+    results = [None] * len(payloads)
+    pending = collections.OrderedDict()
+    for i, (data, source) in enumerate(zip(payloads, sources)):
+        text = _decode_cheap(data)
+        if text is None and source in encoding_cache:
+            text = _try_decode(data, encoding_cache[source])
+        if text is None:
+            pending.setdefault(source, []).append(i)
+        else:
+            results[i] = text
+    if not pending:
+        return results
 
-    # Decode the object into a unicode object
-    out_str = in_str.decode(enc["encoding"])
+    jobs = []
+    for source, indexes in pending.items():
+        if source is None:
+            jobs.extend((None, [i], payloads[i][:sample_size]) for i in indexes)
+            continue
+        sample = bytearray()
+        for i in indexes:
+            sample += payloads[i][:sample_size - len(sample)]
+            if len(sample) >= sample_size:
+                break
+        jobs.append((source, indexes, bytes(sample)))
 
+    backend_name = get_charset_backend(backend).name
+    samples = [(backend_name, sample) for _, _, sample in jobs]
+    if processes == 1 or len(jobs) < _MIN_POOL_JOBS:
+        encodings = list(map(_detect_encoding, samples))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            chunksize = max(1, len(jobs) // ((processes or os.cpu_count() or 1) * 4))
+            encodings = list(pool.map(_detect_encoding, samples, chunksize=chunksize))
+
+    for (source, indexes, _), encoding in zip(jobs, encodings):
+        if source is not None and encoding is not None:
+            encoding_cache[source] = encoding
+        for i in indexes:
+            text = _try_decode(payloads[i], encoding)
+            if text is None:
+                text = detect_and_decode(
+                    payloads[i], sample_size=sample_size, backend=backend_name
+                ).text
+            results[i] = text
+    return results
+
+
+def _decode_cheap(data):
+    for bom, _, codec in _BOMS:
+        if data.startswith(bom):
+            return codecs.decode(data[len(bom):], codec)
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def _try_decode(data, encoding):
+    if encoding is None:
+        return None
+    try:
+        text = data.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
     # Cleanup: Sometimes UTF-16 strings include the BOM
-    if enc["encoding"] == "UTF-16BE":
-        # Remove byte order marks (BOM)
-        if out_str.startswith("\ufeff"):
-            out_str = out_str[1:]
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    return text
+
+
+def _detect_encoding(args):
+    backend_name, data = args
+    return get_charset_backend(backend_name).detect(data)
+
+
+def iter_decode(chunks, sample_size=DETECT_SAMPLE_SIZE, errors="strict",
+                backend=None):
+    """Decodes a stream of bytes of unknown encoding.
+
+    Uses the same tiers as detect_and_decode, see StreamDecoder. To
+    decode a file::
+
+        chunks = iter(lambda: f.read(65536), b"")
+        for text in iter_decode(chunks):
+            ...
+
+    Args:
+
+        chunks (iterable): bytes chunks
+
+    Kwargs:
+
+        sample_size (int): Most bytes buffered before deciding
+
+        errors (str): Error handler of the codec
+
+        backend (str): Charset detector backend, see get_charset_backend
+
+    Returns:
+
+        (generator): Decoded text chunks
+    """
+    decoder = StreamDecoder(sample_size=sample_size, errors=errors,
+                            backend=backend)
+    for chunk in chunks:
+        text = decoder.feed(chunk)
+        if text:
+            yield text
+    text = decoder.close()
+    if text:
+        yield text
+
+
+class StreamDecoder(object):
+    """Incremental decoder for bytes of unknown encoding.
+
+    Chunks are buffered until the encoding is known, then decoded with
+    an incremental codec decoder, so memory stays bounded by
+    sample_size. The encoding is decided by
+
+    1. A byte order mark for UTF-8, UTF-16 or UTF-32 in either byte
+       order. The mark is stripped.
+    2. The first sample_size bytes decoding as strict UTF-8
+    3. The charset detector backend. A UniversalDetector is fed chunk
+       by chunk until it's confident or sample_size bytes have been
+       seen. Backends without one look at the buffered sample.
+
+    Kwargs:
+
+        sample_size (int): Most bytes buffered before deciding
+
+        errors (str): Error handler of the codec
+
+        backend (str): Charset detector backend, see get_charset_backend
+    """
+
+    def __init__(self, sample_size=DETECT_SAMPLE_SIZE, errors="strict",
+                 backend=None):
+        self.sample_size = sample_size
+        self.errors = errors
+        self.backend = backend
+        self.encoding = None
+        self.tier = None
+        self._buffer = bytearray()
+        self._decoder = None
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._detecting = False
+        self._detector = None
+
+    def feed(self, data):
+        """Adds data to the stream.
+
+        Args:
+
+            data (bytes): Next chunk
+
+        Returns:
+
+            (str): Text decoded so far, empty while still detecting
+        """
+        if self._decoder is not None:
+            return self._decoder.decode(data)
+        self._buffer += data
+        if self._detect(data, final=False):
+            return self._start()
+        return ""
+
+    def close(self):
+        """Ends the stream.
+
+        Returns:
+
+            (str): Remaining text
+        """
+        text = ""
+        if self._decoder is None:
+            self._detect(b"", final=True)
+            text = self._start()
+        return text + self._decoder.decode(b"", final=True)
+
+    def _detect(self, data, final):
+        if len(self._buffer) < _MAX_BOM_SIZE and not final:
+            # A BOM split across chunks, e.g. the FF FE of a UTF-32LE
+            # mark, looks like UTF-16 to the detector
+            return False
+        if len(self._buffer) - len(data) < _MAX_BOM_SIZE:
+            # Nothing has been fed to the UTF-8 check yet
+            data = bytes(self._buffer)
+            for bom, encoding, codec in _BOMS:
+                if self._buffer.startswith(bom):
+                    del self._buffer[:len(bom)]
+                    self._use(encoding, codec, TIER_BOM)
+                    return True
+
+        if self._detecting is False:
+            try:
+                self._utf8.decode(data, final=final)
+            except UnicodeDecodeError:
+                self._detecting = True
+                self._backend = get_charset_backend(self.backend)
+                self._detector = self._backend.universal_detector()
+                if self._detector is not None:
+                    self._detector.feed(bytes(self._buffer))
+            else:
+                if final or len(self._buffer) >= self.sample_size:
+                    encoding = "ascii" if self._buffer.isascii() else "utf-8"
+                    self._use(encoding, "utf-8", TIER_UTF8)
+                    return True
+                return False
+        elif self._detector is not None:
+            self._detector.feed(data)
+
+        done = self._detector is not None and self._detector.done
+        if done or final or len(self._buffer) >= self.sample_size:
+            if self._detector is not None:
+                self._detector.close()
+                encoding = self._detector.result["encoding"]
+            else:
+                encoding = self._backend.detect(bytes(self._buffer))
+            if encoding is None:
+                raise ValueError("Unable to detect encoding")
+            self._use(encoding, encoding, TIER_CHARDET)
+            return True
+        return False
+
+    def _use(self, encoding, codec, tier):
+        self.encoding = encoding
+        self.tier = tier
+        self._decoder = codecs.getincrementaldecoder(codec)(errors=self.errors)
 
-    # Return the decoded string
-    return out_str
+    def _start(self):
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        text = self._decoder.decode(data)
+        # Cleanup: Sometimes UTF-16 strings include the BOM
+        if text.startswith("\ufeff"):
+            text = text[1:]
+        return text
@@ -21,25 +21,43 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import collections
+import configparser
+import functools
+import hashlib
+import json
 import logging
+import operator
+import os
+import threading
+import weakref
 
 log = logging.getLogger(__name__)
 
+# Per class cache of which attributes from_object copies. Keyed weakly
+# so classes created on the fly can still be collected.
+_object_plans = weakref.WeakKeyDictionary()
+
+# ConfigFile per absolute path, shared by every ConfigDict.from_file call
+_config_files = {}
+_config_files_lock = threading.Lock()
+
 
 class ConfigDict(dict):
     def __init__(self, *args, **kwargs):
         super(ConfigDict, self).__init__(*args, **kwargs)
-        self.__dict__ = self
+        self._bind_attributes()
         default = kwargs.get("default", {})
         assert isinstance(default, dict)
         self.update(default)
 
+    def _bind_attributes(self):
+        self.__dict__ = self
+
     def update(self, data):
-        _data = {}
-        for k, v in data.items():
-            if k.isupper():
-                _data[k] = v
-        super(ConfigDict, self).update(_data)
+        super(ConfigDict, self).update(
+            {k: v for k, v in data.items() if k.isupper()}
+        )
 
     def from_object(self, obj):
         """Updates the values from the given object
@@ -55,7 +73,485 @@ class ConfigDict(dict):
 
             from yourapplication import default_config
             app.config.from_object(default_config())
+
+        The uppercase attribute names are worked out once per class and
+        reused until an attribute is added to or removed from the class
+        or one of its bases.
+        """
+        if isinstance(obj, type):
+            cls = obj
+            instance_dict = None
+        else:
+            cls = type(obj)
+            instance_dict = getattr(obj, "__dict__", None)
+
+        keys, key_set, getter = _object_plan(cls)
+        if instance_dict:
+            extra = [k for k in instance_dict if k.isupper() and k not in key_set]
+            if extra:
+                keys = keys + tuple(extra)
+                getter = _make_getter(keys)
+        if keys:
+            super(ConfigDict, self).update(zip(keys, getter(obj)))
+
+    def freeze(self):
+        """Returns an immutable snapshot of the uppercase keys
+
+        The snapshot is an instance of a FrozenConfig subclass generated
+        with __slots__ for the current keys, so attribute reads are slot
+        lookups, it uses less memory than a dict and it can be shared
+        between threads without locks. Values aren't copied, so mutable
+        values are still shared with this config.
+
+        Returns:
+
+            (FrozenConfig): Snapshot of this config
+        """
+        return _make_frozen_config(
+            {k: v for k, v in self.items() if _is_config_key(k)}
+        )
+
+    def from_file(self, filename, loader=None):
+        """Updates the values from a JSON, INI or TOML file
+
+        Args:
+
+            filename (str): Path to the config file
+
+        Kwargs:
+
+            loader (callable): Parses the file's text into a dict.
+                               Picked from the file extension if None.
+
+        Returns:
+
+            (bool): True if the file changed since it was last loaded
+
+        Parsed files are cached, see ConfigFile. Loading a file that
+        hasn't changed costs one stat call.
+        """
+        config_file = get_config_file(filename, loader)
+        changed = config_file.check()
+        self.update(config_file.data)
+        return changed
+
+    def from_env(self, prefix):
+        """Updates the values from environment variables
+
+        Args:
+
+            prefix (str): Only variables starting with prefix are used
+                          and the prefix is stripped from the key, so
+                          MYAPP_DEBUG sets DEBUG for prefix "MYAPP_".
+
+        Values that parse as JSON are stored parsed, everything else is
+        stored as a string.
+        """
+        for key, value in os.environ.items():
+            if not key.startswith(prefix):
+                continue
+            key = key[len(prefix):]
+            if not key.isupper():
+                continue
+            try:
+                self[key] = json.loads(value)
+            except ValueError:
+                self[key] = value
+
+
+class AcyclicConfigDict(ConfigDict):
+    """ConfigDict without the reference cycle.
+
+    ConfigDict aliases its __dict__ to itself, so a discarded config is
+    only freed by the cyclic garbage collector. This version forwards
+    attribute access to the dict instead and is freed as soon as its
+    last reference goes away. Attribute reads are a little slower since
+    they go through __getattr__.
+    """
+
+    def _bind_attributes(self):
+        pass
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class LayeredConfig(collections.ChainMap):
+    """Config that looks keys up through a chain of layers.
+
+    Works like collections.ChainMap with ConfigDict semantics: only
+    uppercase keys are visible and they can be read as attributes.
+    Layers aren't copied, so changes to a layer show up right away.
+    Writes go to the first layer. Example usage::
+
+        config = LayeredConfig(tenant_overrides, site_config, defaults)
+        config.APP_NAME
+
+    Args:
+
+        *layers (dict): Layers in lookup order, first one wins
+    """
+
+    def __getitem__(self, key):
+        if not _is_config_key(key):
+            raise KeyError(key)
+        return super(LayeredConfig, self).__getitem__(key)
+
+    def __contains__(self, key):
+        return _is_config_key(key) and any(key in m for m in self.maps)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        seen = set()
+        for mapping in self.maps:
+            for key in mapping:
+                if key not in seen and _is_config_key(key):
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __bool__(self):
+        return any(True for _ in self)
+
+    def update(self, data):
+        self.maps[0].update(
+            {k: v for k, v in data.items() if _is_config_key(k)}
+        )
+
+    def __getattr__(self, name):
+        if not _is_config_key(name):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if _is_config_key(name):
+            self[name] = value
+        else:
+            super(LayeredConfig, self).__setattr__(name, value)
+
+    def snapshot(self):
+        """Flattens the layers into a ConfigDict.
+
+        For hot paths that read many keys. The snapshot is a copy, later
+        changes to the layers aren't reflected in it.
+
+        Returns:
+
+            (ConfigDict): Current values of all layers
+        """
+        flat = {}
+        for mapping in reversed(self.maps):
+            flat.update(mapping)
+        config = ConfigDict()
+        config.update({k: v for k, v in flat.items() if _is_config_key(k)})
+        return config
+
+
+class FrozenConfig(object):
+    """Immutable config snapshot, see ConfigDict.freeze.
+
+    Supports attribute access as well as the read only parts of the
+    mapping interface.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _field_set = frozenset()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenConfig is read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("FrozenConfig is read only")
+
+    def __getitem__(self, key):
+        if key not in self._field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._field_set
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenConfig):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "FrozenConfig({!r})".format(self.to_dict())
+
+    def keys(self):
+        return self._fields
+
+    def get(self, key, default=None):
+        if key not in self._field_set:
+            return default
+        return getattr(self, key)
+
+    def to_dict(self):
+        """Returns the snapshot as a plain dict"""
+        return {k: getattr(self, k) for k in self._fields}
+
+    # Immutable, so copies can be the snapshot itself. The generated
+    # classes aren't importable, so pickles rebuild from a dict.
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _make_frozen_config, (self.to_dict(),)
+
+
+def _make_frozen_config(data):
+    keys = tuple(sorted(data))
+    frozen = object.__new__(_frozen_config_class(keys))
+    for key in keys:
+        object.__setattr__(frozen, key, data[key])
+    return frozen
+
+
+@functools.lru_cache(maxsize=128)
+def _frozen_config_class(keys):
+    # Slots starting with two underscores would be name mangled
+    bad = [k for k in keys if not k.isidentifier() or k.startswith("__")]
+    if bad:
+        raise ValueError("Can't freeze config keys: {}".format(", ".join(bad)))
+    return type(
+        "FrozenConfig",
+        (FrozenConfig,),
+        {"__slots__": keys, "_fields": keys, "_field_set": frozenset(keys)},
+    )
+
+
+def _is_config_key(key):
+    return isinstance(key, str) and key.isupper()
+
+
+class ConfigFile(object):
+    """Config file whose parsed contents are cached until it changes.
+
+    check() stats the file and compares mtime, size and inode with the
+    last load. Only when those differ is the file read, and it's only
+    parsed again when its sha256 hash differs too.
+
+    Args:
+
+        filename (str): Path to a .json, .ini, .cfg or .toml file
+
+    Kwargs:
+
+        loader (callable): Parses the file's text into a dict. Picked
+                           from the file extension if None.
+    """
+
+    def __init__(self, filename, loader=None):
+        self.filename = os.path.abspath(filename)
+        if loader is None:
+            ext = os.path.splitext(self.filename)[1].lower()
+            try:
+                loader = _FILE_LOADERS[ext]
+            except KeyError:
+                raise ValueError("Unsupported config file: {}".format(filename))
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._digest = None
+        self._data = None
+
+    @property
+    def data(self):
+        """(dict): Parsed contents of the file"""
+        if self._data is None:
+            self.check()
+        return self._data
+
+    def check(self):
+        """Reloads the file if it changed.
+
+        Returns:
+
+            (bool): True if the contents changed since the last check
         """
-        for key in dir(obj):
-            if key.isupper():
-                self[key] = getattr(obj, key)
+        st = os.stat(self.filename)
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat_key == self._stat_key:
+            return False
+
+        with self._lock:
+            if stat_key == self._stat_key:
+                return False
+            with open(self.filename, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).digest()
+            changed = digest != self._digest
+            if changed:
+                self._data = self.loader(raw.decode("utf-8"))
+                self._digest = digest
+            self._stat_key = stat_key
+        return changed
+
+    def watch(self, callback, interval=1.0):
+        """Polls the file on a background thread.
+
+        Args:
+
+            callback (callable): Called with this ConfigFile after each
+                                 change
+
+        Kwargs:
+
+            interval (float): Seconds between checks
+
+        Returns:
+
+            (threading.Event): Set it to stop watching
+        """
+        stop = threading.Event()
+
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    changed = self.check()
+                except Exception as err:
+                    log.debug(err, exc_info=True)
+                    continue
+                if changed:
+                    try:
+                        callback(self)
+                    except Exception as err:
+                        log.debug(err, exc_info=True)
+
+        thread = threading.Thread(target=poll, name="dsdev-config-watch")
+        thread.daemon = True
+        thread.start()
+        return stop
+
+
+def get_config_file(filename, loader=None):
+    """Returns the shared ConfigFile for filename"""
+    path = os.path.abspath(filename)
+    with _config_files_lock:
+        config_file = _config_files.get(path)
+        if config_file is None or (loader is not None and
+                                   config_file.loader is not loader):
+            config_file = ConfigFile(path, loader)
+            _config_files[path] = config_file
+    return config_file
+
+
+def _load_json(text):
+    return json.loads(text)
+
+
+def _load_ini(text):
+    # Options from [DEFAULT] become top level keys, every other section
+    # becomes a dict. Option names keep their case.
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    parser.read_string(text)
+    data = dict(parser.defaults())
+    for section in parser.sections():
+        data[section] = {
+            k: v for k, v in parser.items(section) if k not in parser.defaults()
+        }
+    return data
+
+
+def _load_toml(text):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise RuntimeError("TOML config files need Python 3.11+ or tomli")
+    return tomllib.loads(text)
+
+
+_FILE_LOADERS = {
+    ".cfg": _load_ini,
+    ".ini": _load_ini,
+    ".json": _load_json,
+    ".toml": _load_toml,
+}
+
+
+def _object_plan(cls):
+    try:
+        plan = _object_plans[cls]
+    except (KeyError, TypeError):
+        plan = None
+    if plan is not None and _plan_is_current(cls, plan[0]):
+        return plan[1]
+
+    keys = set()
+    for c in cls.__mro__:
+        keys.update(k for k in vars(c) if k.isupper())
+    keys = tuple(sorted(keys))
+    result = (keys, frozenset(keys), _make_getter(keys))
+    try:
+        _object_plans[cls] = (_class_signature(cls), result)
+    except TypeError:  # pragma: no cover
+        pass
+    return result
+
+
+def _class_signature(cls):
+    # The MRO and the attribute names of every class in it but object,
+    # which can't change. Values aren't part of it since they're read
+    # fresh on every call.
+    mro = cls.__mro__
+    return mro, tuple([frozenset(c.__dict__) for c in mro if c is not object])
+
+
+def _plan_is_current(cls, signature):
+    mro, names = signature
+    if cls.__mro__ is not mro:
+        return False
+    # Comparing a keys view with a frozenset runs in C without building
+    # anything, so checking costs little next to rebuilding the plan
+    for c, c_names in zip(mro, names):
+        if c.__dict__.keys() != c_names:
+            return False
+    return True
+
+
+def _make_getter(keys):
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda obj: (getattr(obj, key),)
+    if not keys:
+        return lambda obj: ()
+    return operator.attrgetter(*keys)
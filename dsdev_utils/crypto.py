@@ -27,6 +27,8 @@ import os
 
 log = logging.getLogger(__name__)
 
+_CHUNK_SIZE = 1024 * 1024
+
 
 def get_package_hashes(filename):
     """Provides hash of given filename.
@@ -41,9 +43,38 @@ def get_package_hashes(filename):
     """
     log.debug("Getting package hashes")
     filename = os.path.abspath(filename)
+    _hash = hashlib.sha256()
+    # Read in chunks so large files don't have to fit in memory.
+    # hashlib releases the GIL, so threads can hash files in parallel.
     with open(filename, "rb") as f:
-        data = f.read()
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            _hash.update(chunk)
 
-    _hash = hashlib.sha256(data).hexdigest()
+    _hash = _hash.hexdigest()
     log.debug("Hash for file %s: %s", filename, _hash)
     return _hash
+
+
+def get_partial_hash(filename, size=4096):
+    """Provides a hash of the first and last bytes of a file. Cheap way
+    to tell apart files of the same size before hashing all of them.
+
+    Args:
+
+        filename (str): Name of file to hash
+
+    Kwargs:
+
+        size (int): Bytes to hash from each end
+
+    Returns:
+
+        (str): sha256 hash
+    """
+    _hash = hashlib.sha256()
+    with open(filename, "rb") as f:
+        _hash.update(f.read(size))
+        # Small files are hashed whole, without reading bytes twice
+        f.seek(max(f.seek(0, os.SEEK_END) - size, size))
+        _hash.update(f.read(size))
+    return _hash.hexdigest()
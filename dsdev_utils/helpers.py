@@ -21,17 +21,39 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import atexit
+import importlib
+import importlib.util
 import io
 import gzip
 import logging
+import os
 import re
 import sys
+import threading
+import time
+import weakref
 from packaging.version import parse
 from deprecated import deprecated
 
 
 log = logging.getLogger(__name__)
 
+# Set to dump the lazy import report to stderr when the process exits
+LAZY_IMPORT_REPORT_ENV = "DSDEV_LAZY_IMPORT_REPORT"
+
+# Lazy imports kept in the report. Proxies created past this, e.g. by a
+# lazy_attr in a function called in a loop, still work but aren't
+# reported.
+MAX_LAZY_IMPORT_RECORDS = 1000
+
+_START = time.perf_counter()
+_lazy_import_records = []
+_lazy_import_records_lock = threading.Lock()
+_pending_lazy_imports = []
+# Size the registries are pruned of dead proxies at, doubles with use
+_lazy_import_prune_at = 64
+
 
 # Decompress gzip data
 #
@@ -82,48 +104,382 @@ def lazy_import(func):
         f = sys._getframe(1)
     except Exception:  # pragma: no cover
         namespace = None
+        module = None
+    else:
+        namespace = f.f_locals
+        module = f.f_globals.get("__name__")
+    return _LazyImport(func.__name__, func, namespace, module)
+
+
+def lazy_module(name):
+    """Returns a module that is executed on first attribute access.
+
+    Unlike lazy_import the result is a real module object placed in
+    sys.modules, built on importlib.util.LazyLoader. Once loaded it is
+    an ordinary module, so there's no overhead left after first use.
+
+        json = lazy_module("json")
+
+    Finding the module happens right away, so a missing module raises
+    ImportError here. Parent packages of a dotted name are imported
+    eagerly.
+
+    Args:
+
+        name (str): Absolute name of the module
+
+    Returns:
+
+        (module): The lazily executed module
+    """
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named {!r}".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # Like the import system, so parent.child works after an import
+        setattr(sys.modules[parent], child, module)
+    loader.exec_module(module)
+    return module
+
+
+def lazy_attr(module, name):
+    """Lazy version of "from module import name".
+
+        OrderedDict = lazy_attr("collections", "OrderedDict")
+
+    Returns a proxy that imports module and fetches name on first use.
+    The proxy forwards attribute access, calls, iteration, indexing and
+    isinstance/issubclass checks. When it loads, every name bound to it
+    in the declaring namespace is rebound to the real object, so later
+    lookups there cost nothing.
+
+    Args:
+
+        module (str): Absolute name of the module
+
+        name (str): Attribute to import from module
+
+    Returns:
+
+        (object): Proxy for the attribute
+    """
+    def loader():
+        return getattr(importlib.import_module(module), name)
+
+    try:
+        f = sys._getframe(1)
+    except Exception:  # pragma: no cover
+        namespace = None
+        declared_in = None
     else:
         namespace = f.f_locals
-    return _LazyImport(func.__name__, func, namespace)
+        declared_in = f.f_globals.get("__name__")
+    return _LazyAttr(name, loader, namespace, declared_in)
+
+
+def prefetch_lazy_imports(delay=0):
+    """Resolves pending lazy imports on a background thread.
+
+    Call it once the program is idle, e.g. right after a CLI shows its
+    prompt, so the first real command doesn't stall on an import. The
+    lazy imports are loaded one at a time in declaration order, handing
+    the GIL back between them. If the main thread hits a lazy import the
+    prefetch thread is loading, it waits for that load to finish instead
+    of importing again. Failed loads are logged and retried on the next
+    access.
+
+    Kwargs:
+
+        delay (float): Seconds to wait before starting
+
+    Returns:
+
+        (threading.Thread): The daemon thread doing the prefetch
+    """
+    thread = threading.Thread(
+        target=_prefetch_lazy_imports,
+        args=(delay,),
+        name="dsdev-lazy-import-prefetch",
+    )
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _prefetch_lazy_imports(delay):
+    if delay:
+        time.sleep(delay)
+    with _lazy_import_records_lock:
+        refs = list(_pending_lazy_imports)
+    for ref in refs:
+        proxy = ref()
+        if proxy is None or proxy._dsdev_lazy_target is not _LazyImport:
+            continue
+        try:
+            proxy._dsdev_lazy_load(trigger="prefetch")
+        except Exception as err:
+            log.debug(err, exc_info=True)
+        del proxy
+        # Let the main thread run between imports
+        time.sleep(0)
+    with _lazy_import_records_lock:
+        _pending_lazy_imports[:] = filter(_is_pending, _pending_lazy_imports)
+
+
+def _is_pending(ref):
+    proxy = ref()
+    return proxy is not None and proxy._dsdev_lazy_target is _LazyImport
+
+
+def _register_lazy_import(proxy):
+    global _lazy_import_prune_at
+    record = proxy._dsdev_lazy_record
+    record.proxy = weakref.ref(proxy)
+    with _lazy_import_records_lock:
+        size = len(_lazy_import_records) + len(_pending_lazy_imports)
+        if size >= _lazy_import_prune_at:
+            # Proxies that went away unresolved have nothing to report
+            _lazy_import_records[:] = [
+                r for r in _lazy_import_records
+                if r.resolved_at is not None or r.proxy() is not None
+            ]
+            _pending_lazy_imports[:] = filter(_is_pending,
+                                              _pending_lazy_imports)
+            size = len(_lazy_import_records) + len(_pending_lazy_imports)
+            _lazy_import_prune_at = max(64, size * 2)
+        if len(_lazy_import_records) < MAX_LAZY_IMPORT_RECORDS:
+            _lazy_import_records.append(record)
+        _pending_lazy_imports.append(record.proxy)
+
+
+def lazy_import_report():
+    """Returns what each lazy import cost and who resolved it.
+
+    Returns:
+
+        (list): One dict per lazy import, in declaration order, with keys
+
+            name - Name the proxy was bound to
+
+            module - Module the lazy import was declared in
+
+            resolved - True if the loader has run
+
+            resolved_at - Seconds after dsdev_utils.helpers was imported
+
+            load_time - Seconds spent in the loader
+
+            triggered_by - "file:line in function" of the first access,
+                           or "prefetch"
+
+            thread - Name of the thread that ran the loader
+
+        Lazy imports that are never resolved are candidates for removal,
+        ones resolved right away belong off the startup path or should
+        be eager.
+
+        Only the first MAX_LAZY_IMPORT_RECORDS lazy imports are kept, and
+        ones whose proxy was garbage collected unresolved are dropped.
+    """
+    with _lazy_import_records_lock:
+        records = list(_lazy_import_records)
+    return [r.as_dict() for r in records]
+
+
+def format_lazy_import_report():
+    """Returns lazy_import_report as a human readable table"""
+    lines = ["{:<40} {:>10} {:>10}  {}".format(
+        "lazy import", "at (s)", "load (ms)", "triggered by")]
+    for r in lazy_import_report():
+        name = "{}.{}".format(r["module"], r["name"])
+        if r["resolved"] is False:
+            lines.append("{:<40} {:>10} {:>10}  {}".format(
+                name, "-", "-", "never resolved"))
+            continue
+        lines.append("{:<40} {:>10.4f} {:>10.2f}  {} [{}]".format(
+            name, r["resolved_at"], r["load_time"] * 1000,
+            r["triggered_by"], r["thread"]))
+    return "\n".join(lines)
+
+
+def _dump_lazy_import_report():  # pragma: no cover
+    sys.stderr.write(format_lazy_import_report() + "\n")
+
+
+if os.environ.get(LAZY_IMPORT_REPORT_ENV):  # pragma: no cover
+    atexit.register(_dump_lazy_import_report)
+
+
+class _LazyImportRecord(object):
+
+    __slots__ = ("name", "module", "resolved_at", "load_time",
+                 "triggered_by", "thread", "proxy")
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+        self.proxy = None
+        self.resolved_at = None
+        self.load_time = None
+        self.triggered_by = None
+        self.thread = None
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "module": self.module,
+            "resolved": self.resolved_at is not None,
+            "resolved_at": self.resolved_at,
+            "load_time": self.load_time,
+            "triggered_by": self.triggered_by,
+            "thread": self.thread,
+        }
+
+
+def _caller_outside_helpers():
+    f = sys._getframe(1)
+    here = _caller_outside_helpers.__code__.co_filename
+    while f is not None and f.f_code.co_filename == here:
+        f = f.f_back
+    if f is None:  # pragma: no cover
+        return None
+    return "{}:{} in {}".format(
+        f.f_code.co_filename, f.f_lineno, f.f_code.co_name)
 
 
 class _LazyImport(object):
-    """Class representing a lazy import."""
+    """Class representing a lazy import.
 
-    def __init__(self, name, loader, namespace=None):
+    The loader runs at most once, under a lock, so threads racing on the
+    first access all get the same object. Once loaded, the proxy's
+    instance dict is the target's namespace, so attribute reads are
+    plain dict lookups that never reach __getattr__.
+    """
+
+    __slots__ = (
+        "__dict__",
+        "_dsdev_lazy_target",
+        "_dsdev_lazy_name",
+        "_dsdev_lazy_loader",
+        "_dsdev_lazy_namespace",
+        "_dsdev_lazy_lock",
+        "_dsdev_lazy_record",
+        "__weakref__",
+    )
+
+    def __init__(self, name, loader, namespace=None, module=None):
         self._dsdev_lazy_target = _LazyImport
         self._dsdev_lazy_name = name
         self._dsdev_lazy_loader = loader
         self._dsdev_lazy_namespace = namespace
-
-    def _dsdev_lazy_load(self):
-        if self._dsdev_lazy_target is _LazyImport:
-            self._dsdev_lazy_target = self._dsdev_lazy_loader()
+        self._dsdev_lazy_lock = threading.RLock()
+        self._dsdev_lazy_record = _LazyImportRecord(name, module)
+        _register_lazy_import(self)
+
+    def _dsdev_lazy_load(self, trigger=None):
+        with self._dsdev_lazy_lock:
+            if self._dsdev_lazy_target is not _LazyImport:
+                return self._dsdev_lazy_target
+            record = self._dsdev_lazy_record
+            record.triggered_by = trigger or _caller_outside_helpers()
+            record.thread = threading.current_thread().name
+            start = time.perf_counter()
+            target = self._dsdev_lazy_loader()
+            record.load_time = time.perf_counter() - start
+            record.resolved_at = start - _START
             ns = self._dsdev_lazy_namespace
             if ns is not None:
-                try:
-                    if ns[self._dsdev_lazy_name] is self:
-                        ns[self._dsdev_lazy_name] = self._dsdev_lazy_target
-                except KeyError:  # pragma: no cover
-                    pass
-
-    def __getattribute__(self, attr):  # pragma: no cover
-        try:
-            return object.__getattribute__(self, attr)
-        except AttributeError:
-            if self._dsdev_lazy_target is _LazyImport:
-                self._dsdev_lazy_load()
-            return getattr(self._dsdev_lazy_target, attr)
-
-    def __nonzero__(self):  # pragma: no cover
-        if self._dsdev_lazy_target is _LazyImport:
-            self._dsdev_lazy_load()
-        return bool(self._dsdev_lazy_target)
+                # Rebind every name the proxy is bound to, aliases included
+                for key, value in list(ns.items()):
+                    if value is self:
+                        ns[key] = target
+            target_dict = getattr(target, "__dict__", None)
+            if type(target_dict) is dict:
+                self.__dict__ = target_dict
+            self._dsdev_lazy_target = target
+            return target
+
+    def __getattr__(self, attr):
+        if attr.startswith("_dsdev_lazy_"):
+            raise AttributeError(attr)
+        target = self._dsdev_lazy_target
+        if target is _LazyImport:
+            target = self._dsdev_lazy_load()
+        return getattr(target, attr)
+
+    def __bool__(self):  # pragma: no cover
+        target = self._dsdev_lazy_target
+        if target is _LazyImport:
+            target = self._dsdev_lazy_load()
+        return bool(target)
+
+    __nonzero__ = __bool__
 
     def __str__(self):  # pragma: no cover
         return "_LazyImport: {}".format(self._dsdev_lazy_name)
 
 
+class _LazyAttr(_LazyImport):
+    """Lazy import of a single attribute, see lazy_attr.
+
+    Functions and classes are used through protocols that are looked up
+    on the type, so those are forwarded here explicitly.
+    """
+
+    __slots__ = ()
+
+    def _dsdev_lazy_get(self):
+        target = self._dsdev_lazy_target
+        if target is _LazyImport:
+            target = self._dsdev_lazy_load()
+        return target
+
+    def __call__(self, *args, **kwargs):
+        return self._dsdev_lazy_get()(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._dsdev_lazy_get())
+
+    def __len__(self):
+        return len(self._dsdev_lazy_get())
+
+    def __contains__(self, item):
+        return item in self._dsdev_lazy_get()
+
+    def __getitem__(self, key):
+        return self._dsdev_lazy_get()[key]
+
+    def __eq__(self, other):
+        return self._dsdev_lazy_get() == other
+
+    def __ne__(self, other):
+        return self._dsdev_lazy_get() != other
+
+    def __hash__(self):
+        return hash(self._dsdev_lazy_get())
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._dsdev_lazy_get())
+
+    def __subclasscheck__(self, subclass):
+        return issubclass(subclass, self._dsdev_lazy_get())
+
+    def __repr__(self):
+        return repr(self._dsdev_lazy_get())
+
+    def __str__(self):
+        return str(self._dsdev_lazy_get())
+
+
 # Normalizes version strings of different types. Examples
 # include 1.2, 1.2.1, 1.2b and 1.1.1b
 #
@@ -260,3 +616,77 @@ class EasyAccessDict(object):
 
     def __str__(self):
         return str(self.dict)
+
+
+_MERGE_POLICIES = ("left", "right", "newer")
+
+
+# Merges two nested dicts without copying them. Only the levels where
+# both dicts hold a dict under the same key are rebuilt, every other
+# subtree is shared by reference with the inputs. Neither input is
+# modified, but the result should be treated as read only since it may
+# share subtrees with them. Meant for combining manifests before
+# wrapping them in an EasyAccessDict.
+#
+# Args:
+#
+#     left (dict): Base dict
+#
+#     right (dict): Dict merged on top of left
+#
+# Kwargs:
+#
+#     conflict (str): How to resolve two different non-dict values
+#                     stored under the same key.
+#
+#         Meaning:
+#
+#             "left" - Keep the value from left
+#
+#             "right" - Keep the value from right
+#
+#             "newer" - Keep the value that parses as the newer Version.
+#                       Falls back to right if either isn't a version.
+#
+# Returns:
+#
+#     (dict): Merged dict
+def merge_dicts(left, right, conflict="right"):
+    if conflict not in _MERGE_POLICIES:
+        raise ValueError("Unknown conflict policy: {}".format(conflict))
+    return _merge_dicts(left, right, conflict)
+
+
+def _merge_dicts(left, right, conflict):
+    if left is right or not right:
+        return left
+    if not left:
+        return right
+
+    common = left.keys() & right.keys()
+    if conflict == "left":
+        merged = dict(right)
+        merged.update(left)
+    else:
+        merged = dict(left)
+        merged.update(right)
+
+    for key in common:
+        l_value = left[key]
+        r_value = right[key]
+        if l_value is r_value:
+            continue
+        if isinstance(l_value, dict) and isinstance(r_value, dict):
+            merged[key] = _merge_dicts(l_value, r_value, conflict)
+        elif conflict == "newer":
+            merged[key] = _newer_value(l_value, r_value)
+    return merged
+
+
+def _newer_value(left, right):
+    try:
+        if Version(left) > Version(right):
+            return left
+    except Exception:
+        pass
+    return right
@@ -0,0 +1,219 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+import logging
+import marshal
+import struct
+import sys
+
+log = logging.getLogger(__name__)
+
+# Binary layout
+#
+#   MAGIC | format version (B) | marshal version (B) | key table size (Q)
+#   | key table | root node
+#
+# The key table is a marshaled tuple holding every indexed dict key once.
+# A node is either
+#
+#   b"D" | count (I) | count * (key id (I), child offset (Q)) | children
+#
+# for an indexed dict, or
+#
+#   b"M" | size (Q) | marshaled value
+#
+# for everything below the indexed depth. Child offsets are relative to
+# the start of the root node, so a lookup only reads the nodes on its
+# path and skips every other subtree.
+#
+# marshal isn't safe against malformed or malicious data, a bad blob can
+# crash the interpreter. Only load manifests that were generated locally
+# or whose signature has been verified.
+MAGIC = b"DSMF"
+FORMAT_VERSION = 2
+
+_MARSHAL_VERSION = 4
+_HEADER = struct.Struct("<4sBBQ")
+_COUNT = struct.Struct("<I")
+_ENTRY = struct.Struct("<IQ")
+_SIZE = struct.Struct("<Q")
+_DICT = b"D"
+_BLOB = b"M"
+
+
+def dumps_manifest(data, index_depth=2):
+    """Serializes a nested dict into the binary manifest format.
+
+    Args:
+
+        data (dict): Manifest to serialize
+
+    Kwargs:
+
+        index_depth (int): Number of dict levels that get an offset
+                           table. Subtrees below this depth are stored
+                           as a single length prefixed blob.
+
+    Returns:
+
+        (bytes): Serialized manifest
+    """
+    keys = {}
+    body = bytearray()
+    _encode(data, index_depth, keys, body)
+    key_table = marshal.dumps(tuple(k for _, k in keys), _MARSHAL_VERSION)
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, _MARSHAL_VERSION, len(key_table)
+    )
+    return header + key_table + bytes(body)
+
+
+def loads_manifest(buf, key=None, sep="*"):
+    """Loads a manifest created with dumps_manifest.
+
+    Values are stored with marshal, which isn't safe against malformed
+    or malicious data. Only pass trusted input: manifests generated
+    locally or downloaded ones whose signature has been verified.
+
+    Args:
+
+        buf (bytes): Serialized manifest
+
+    Kwargs:
+
+        key (str): Only load the value at this key. Uses the same
+                   format as EasyAccessDict.get, e.g. updates*mac
+
+        sep (str): Used as a delimiter between keys
+
+    Raises:
+
+        ValueError: buf isn't a manifest or was written with another
+                    format or marshal version
+
+    Returns:
+
+        (object): The manifest, the value of key or None if key
+                  isn't found
+    """
+    view = memoryview(buf)
+
+    def read(offset, size):
+        return view[offset:offset + size]
+
+    return _load(read, key, sep)
+
+
+def dump_manifest(data, filename, index_depth=2):
+    """Writes a manifest to filename. See dumps_manifest."""
+    with open(filename, "wb") as f:
+        f.write(dumps_manifest(data, index_depth=index_depth))
+
+
+def load_manifest(filename, key=None, sep="*"):
+    """Reads a manifest from filename. See loads_manifest.
+
+    When a key is given only the nodes on its path are read from disk.
+    Like loads_manifest, only for trusted files: generated locally or
+    with a verified signature.
+    """
+    with open(filename, "rb") as f:
+        if key is None:
+            return loads_manifest(f.read())
+
+        def read(offset, size):
+            f.seek(offset)
+            return f.read(size)
+
+        return _load(read, key, sep)
+
+
+def _encode(obj, depth, keys, out):
+    if depth > 0 and type(obj) is dict:
+        out += _DICT + _COUNT.pack(len(obj))
+        table_pos = len(out)
+        out += bytes(_ENTRY.size * len(obj))
+        for i, (k, v) in enumerate(obj.items()):
+            # Keyed on the type too, True, 1 and 1.0 are equal as keys
+            key_id = keys.setdefault((type(k), k), len(keys))
+            _ENTRY.pack_into(out, table_pos + _ENTRY.size * i, key_id, len(out))
+            _encode(v, depth - 1, keys, out)
+    else:
+        blob = marshal.dumps(obj, _MARSHAL_VERSION)
+        out += _BLOB + _SIZE.pack(len(blob)) + blob
+
+
+def _load(read, key, sep):
+    magic, version, marshal_version, key_table_size = _HEADER.unpack(
+        read(0, _HEADER.size)
+    )
+    if magic != MAGIC:
+        raise ValueError("Not a manifest file")
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported manifest version: {}".format(version))
+    if marshal_version != _MARSHAL_VERSION:
+        raise ValueError(
+            "Unsupported marshal version: {}".format(marshal_version)
+        )
+
+    keys = marshal.loads(read(_HEADER.size, key_table_size))
+    keys = tuple(sys.intern(k) if type(k) is str else k for k in keys)
+    base = _HEADER.size + key_table_size
+
+    if key is None:
+        return _decode(read, base, 0, keys)
+
+    offset = 0
+    layers = key.split(sep)
+    for i, layer in enumerate(layers):
+        if bytes(read(base + offset, 1)) != _DICT:
+            value = _decode(read, base, offset, keys)
+            try:
+                for layer in layers[i:]:
+                    value = value[layer]
+            except (KeyError, TypeError, IndexError):
+                return None
+            return value
+        for key_id, child in _entries(read, base, offset):
+            if keys[key_id] == layer:
+                offset = child
+                break
+        else:
+            return None
+    return _decode(read, base, offset, keys)
+
+
+def _entries(read, base, offset):
+    (count,) = _COUNT.unpack(read(base + offset + 1, _COUNT.size))
+    table = read(base + offset + 1 + _COUNT.size, _ENTRY.size * count)
+    return _ENTRY.iter_unpack(table)
+
+
+def _decode(read, base, offset, keys):
+    if bytes(read(base + offset, 1)) == _DICT:
+        return {
+            keys[key_id]: _decode(read, base, child, keys)
+            for key_id, child in _entries(read, base, offset)
+        }
+    (size,) = _SIZE.unpack(read(base + offset + 1, _SIZE.size))
+    return marshal.loads(read(base + offset + 1 + _SIZE.size, size))
@@ -21,14 +21,81 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import collections
+import concurrent.futures
+import contextvars
+import errno
+import functools
 import logging
 import os
+import queue
 import shutil
+import stat
+import subprocess
 import sys
+import threading
 import time
+import uuid
+
+from dsdev_utils.crypto import get_package_hashes, get_partial_hash
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 log = logging.getLogger(__name__)
 
+# Returned by parallel removals. errors counts entries that couldn't be
+# removed, which are skipped like shutil.rmtree(ignore_errors=True) does.
+RemoveStats = collections.namedtuple("RemoveStats", "files dirs bytes errors")
+
+# Returned by scan_tree. dirs doesn't count the scanned directory itself.
+DirStats = collections.namedtuple("DirStats", "files dirs bytes")
+
+# Entries of the groups find_duplicates returns. The stat fields let
+# link_duplicates skip files changed since.
+DuplicateFile = collections.namedtuple(
+    "DuplicateFile", "path size mtime_ns ino"
+)
+
+# Returned by copy_tree
+CopyStats = collections.namedtuple("CopyStats", "files dirs bytes")
+
+# Linux ioctl sharing the source's extents with the destination,
+# _IOW(0x94, 9, int) from linux/fs.h. Btrfs, XFS and overlayfs on top
+# of those support it.
+FICLONE = 0x40049409
+
+# Errors meaning a copy method isn't supported for this pair of files
+_COPY_FALLBACK_ERRNOS = frozenset(
+    getattr(errno, name)
+    for name in ("EXDEV", "ENOSYS", "EINVAL", "EOPNOTSUPP", "ENOTSUP",
+                 "ENOTTY", "EBADF", "EPERM")
+    if hasattr(errno, name)
+)
+
+# renameat2 flag exchanging two paths atomically, from linux/fs.h
+RENAME_EXCHANGE = 2
+_AT_FDCWD = -100
+
+_COPY_CHUNK_SIZE = 1024 * 1024 * 8
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+# Directory remove_later moves things into, next to the removed path
+TRASH_DIR_NAME = ".dsdev-trash"
+
+_trash_queue = queue.Queue()
+_trash_lock = threading.Lock()
+_trash_worker = None
+_trash_dirs_seen = set()
+
+# (path, directory fd or None, enclosing value) of the innermost WorkDir
+# in this context
+_work_dir = contextvars.ContextVar("dsdev_work_dir", default=None)
+_DIR_FD_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+_USE_DIR_FD = hasattr(os, "O_DIRECTORY") and os.open in os.supports_dir_fd
+
 
 def get_mac_dot_app_dir(directory):
     """Returns parent directory of mac .app
@@ -44,7 +111,25 @@ def get_mac_dot_app_dir(directory):
     return os.path.dirname(os.path.dirname(os.path.dirname(directory)))
 
 
-def remove_any(path):
+def remove_any(path, workers=None):
+    """Removes a file or directory tree, ignoring errors.
+
+    Args:
+
+        path (str): File or directory to remove
+
+    Kwargs:
+
+        workers (int): Remove directory trees with this many threads,
+                       see remove_tree. None uses shutil.rmtree.
+
+    Returns:
+
+        (RemoveStats): What was removed, only when workers is given
+    """
+    if workers is not None:
+        return remove_tree(path, workers=workers)
+
     if not os.path.exists(path):
         return
 
@@ -72,6 +157,946 @@ def remove_any(path):
                 log.debug(err, exc_info=True)
 
 
+def remove_tree(path, workers=8):
+    """Removes a file or directory tree using a thread pool.
+
+    Directories are scanned with os.scandir and their files unlinked in
+    parallel, then the directories are removed bottom up, one level at a
+    time. Much faster than shutil.rmtree for trees with many small files
+    on network backed volumes. Errors are ignored, like remove_any does,
+    and counted in the result.
+
+    Args:
+
+        path (str): File or directory to remove
+
+    Kwargs:
+
+        workers (int): Number of threads
+
+    Returns:
+
+        (RemoveStats): Files, directories and bytes removed and the
+                       number of errors
+    """
+    path = os.fspath(path)
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return RemoveStats(0, 0, 0, 0)
+    if not stat.S_ISDIR(st.st_mode):
+        try:
+            os.unlink(path)
+        except OSError as err:
+            log.debug(err, exc_info=True)
+            return RemoveStats(0, 0, 0, 1)
+        return RemoveStats(1, 0, st.st_size, 0)
+
+    files = size = errors = 0
+    levels = [[path]]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(_clear_dir, path): 0}
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                depth = pending.pop(future) + 1
+                subdirs, f_count, f_size, f_errors = future.result()
+                files += f_count
+                size += f_size
+                errors += f_errors
+                if subdirs and len(levels) <= depth:
+                    levels.append([])
+                for subdir in subdirs:
+                    levels[depth].append(subdir)
+                    pending[pool.submit(_clear_dir, subdir)] = depth
+
+        dirs = 0
+        for level in reversed(levels):
+            for removed in pool.map(_remove_dir, level):
+                if removed:
+                    dirs += 1
+                else:
+                    errors += 1
+    return RemoveStats(files, dirs, size, errors)
+
+
+def _clear_dir(path):
+    # Unlinks everything but directories in path and returns the
+    # directories for the caller to schedule.
+    subdirs = []
+    files = size = errors = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError as err:
+        log.debug(err, exc_info=True)
+        return subdirs, files, size, 1
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            entry_size = entry.stat(follow_symlinks=False).st_size
+            os.unlink(entry.path)
+        except OSError as err:
+            log.debug(err, exc_info=True)
+            errors += 1
+        else:
+            files += 1
+            size += entry_size
+    return subdirs, files, size, errors
+
+
+def _remove_dir(path):
+    try:
+        os.rmdir(path)
+    except OSError as err:
+        log.debug(err, exc_info=True)
+        return False
+    return True
+
+
+def scan_tree(path, workers=1, cache=None):
+    """Counts files, directories and bytes in a directory tree.
+
+    Walks with os.scandir and sizes files from DirEntry.stat, which on
+    Windows comes for free with the listing. Symlinks are counted as
+    files and not followed.
+
+    With a cache, each directory's own file count and size and its
+    subdirectories are stored keyed by the directory's mtime. On the
+    next scan a directory whose mtime hasn't changed isn't listed and
+    its files aren't stat'ed, so an unchanged tree costs one stat per
+    directory. A directory's mtime only changes when entries are added,
+    removed or renamed, so files rewritten in place keep their cached
+    size until their directory changes.
+
+    Args:
+
+        path (str): Directory to scan
+
+    Kwargs:
+
+        workers (int): Threads scanning subtrees in parallel
+
+        cache (dict): Reused between scans, pass an empty dict first
+
+    Returns:
+
+        (DirStats): Totals for the tree
+    """
+    path = os.path.abspath(os.fspath(path))
+    files = dirs = size = 0
+    if workers <= 1:
+        stack = [path]
+        while stack:
+            f_count, f_size, subdirs = _scan_dir(stack.pop(), cache)
+            files += f_count
+            size += f_size
+            dirs += len(subdirs)
+            stack.extend(subdirs)
+        return DirStats(files, dirs, size)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(_scan_dir, path, cache)}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                f_count, f_size, subdirs = future.result()
+                files += f_count
+                size += f_size
+                dirs += len(subdirs)
+                for subdir in subdirs:
+                    pending.add(pool.submit(_scan_dir, subdir, cache))
+    return DirStats(files, dirs, size)
+
+
+def _scan_dir(path, cache):
+    # Returns the file count and size of path itself and its
+    # subdirectories. The stat comes before the listing so a change
+    # during the scan gives a new mtime next time.
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError as err:
+        log.debug(err, exc_info=True)
+        return 0, 0, ()
+    if cache is not None:
+        cached = cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1:]
+
+    files = size = 0
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError as err:
+                    log.debug(err, exc_info=True)
+    except OSError as err:
+        log.debug(err, exc_info=True)
+        return 0, 0, ()
+    result = (files, size, tuple(subdirs))
+    if cache is not None:
+        cache[path] = (mtime,) + result
+    return result
+
+
+def copy_file(src, dst):
+    """Copies a file's data and metadata without going through userspace
+    where the platform allows it.
+
+    Tries a reflink (FICLONE), which makes the copy share the source's
+    blocks and is near instant on Btrfs and XFS. Then os.copy_file_range
+    which copies inside the kernel and lets NFS and SMB copy server
+    side, then os.sendfile and last a buffered read and write. Every
+    method carries on from where the previous one stopped. Metadata is
+    copied like shutil.copy2 does.
+
+    Args:
+
+        src (str): File to copy
+
+        dst (str): Destination file, replaced if it exists
+
+    Raises:
+
+        shutil.SameFileError: src and dst are the same file
+
+        shutil.SpecialFileError: src is a named pipe
+
+    Returns:
+
+        (str): Method that finished the copy, one of "reflink",
+               "copy_file_range", "sendfile" or "buffered"
+    """
+    src = os.fspath(src)
+    dst = os.fspath(dst)
+    # Opening dst for writing would truncate src
+    try:
+        if os.path.samefile(src, dst):
+            raise shutil.SameFileError(
+                "{!r} and {!r} are the same file".format(src, dst))
+    except FileNotFoundError:
+        pass
+    if stat.S_ISFIFO(os.stat(src).st_mode):
+        raise shutil.SpecialFileError("`{}` is a named pipe".format(src))
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        method = _copy_fd(fsrc.fileno(), fdst.fileno(),
+                          os.fstat(fsrc.fileno()).st_size)
+    shutil.copystat(src, dst)
+    return method
+
+
+def _copy_fd(src_fd, dst_fd, size):
+    if fcntl is not None and sys.platform.startswith("linux"):
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        except OSError as err:
+            log.debug("reflink failed: %s", err)
+        else:
+            return "reflink"
+
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            while True:
+                if copy_file_range(src_fd, dst_fd, _COPY_CHUNK_SIZE) == 0:
+                    break
+        except OSError as err:
+            if err.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            log.debug("copy_file_range failed: %s", err)
+        else:
+            # Some virtual filesystems report 0 bytes copied for files
+            # with data, which the buffered copy finds out about
+            if os.lseek(src_fd, 0, os.SEEK_CUR) >= size:
+                return "copy_file_range"
+
+    sendfile = getattr(os, "sendfile", None)
+    if sendfile is not None and sys.platform.startswith("linux"):
+        try:
+            while True:
+                if sendfile(dst_fd, src_fd, None, _COPY_CHUNK_SIZE) == 0:
+                    break
+        except OSError as err:
+            if err.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            log.debug("sendfile failed: %s", err)
+        else:
+            if os.lseek(src_fd, 0, os.SEEK_CUR) >= size:
+                return "sendfile"
+
+    while True:
+        buf = os.read(src_fd, _COPY_BUFFER_SIZE)
+        if not buf:
+            break
+        view = memoryview(buf)
+        while view:
+            view = view[os.write(dst_fd, view):]
+    return "buffered"
+
+
+def copy_tree(src, dst, workers=8):
+    """Copies a directory tree with copy_file, many files at a time.
+
+    Like shutil.copytree(src, dst, symlinks=True): dst must not exist,
+    symlinks are recreated rather than followed and metadata is copied.
+    Directories are created while walking src and files are copied on a
+    thread pool, which keeps several requests in flight on network
+    volumes and for filesystems that can't reflink.
+
+    Args:
+
+        src (str): Directory to copy
+
+        dst (str): Directory to create
+
+    Kwargs:
+
+        workers (int): Number of threads
+
+    Raises:
+
+        shutil.Error: With a list of (src, dst, reason) for each entry
+                      that couldn't be copied, after copying the rest
+
+    Returns:
+
+        (CopyStats): Files, directories and bytes copied
+    """
+    src = os.fspath(src)
+    dst = os.fspath(dst)
+    os.makedirs(dst)
+    dirs = [(src, dst)]
+    files = size = 0
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = {}
+        stack = [(src, dst)]
+        while stack:
+            src_dir, dst_dir = stack.pop()
+            try:
+                entries = list(os.scandir(src_dir))
+            except OSError as err:
+                errors.append((src_dir, dst_dir, str(err)))
+                continue
+            for entry in entries:
+                dst_path = os.path.join(dst_dir, entry.name)
+                try:
+                    if entry.is_symlink():
+                        os.symlink(os.readlink(entry.path), dst_path)
+                        files += 1
+                    elif entry.is_dir():
+                        os.mkdir(dst_path)
+                        dirs.append((entry.path, dst_path))
+                        stack.append((entry.path, dst_path))
+                    elif not entry.is_file():
+                        # Opening a FIFO would block forever, and devices
+                        # and sockets can't be copied either
+                        errors.append((entry.path, dst_path,
+                                       "`{}` is not a regular file".format(
+                                           entry.path)))
+                    else:
+                        entry_size = entry.stat().st_size
+                        future = pool.submit(copy_file, entry.path, dst_path)
+                        futures[future] = (entry.path, dst_path, entry_size)
+                except OSError as err:
+                    errors.append((entry.path, dst_path, str(err)))
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except OSError as err:
+                errors.append(futures[future][:2] + (str(err),))
+            else:
+                files += 1
+                size += futures[future][2]
+
+    # After the files so copying into them doesn't touch their mtimes
+    for src_dir, dst_dir in dirs:
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError as err:
+            errors.append((src_dir, dst_dir, str(err)))
+    if errors:
+        raise shutil.Error(errors)
+    return CopyStats(files, len(dirs) - 1, size)
+
+
+def find_duplicates(paths, min_size=1, partial_size=4096, workers=8):
+    """Finds files with the same contents.
+
+    Files are grouped by size first, which costs nothing beyond the
+    directory scan. Files sharing a size are grouped by get_partial_hash
+    of their first and last partial_size bytes, and those still sharing
+    one are hashed in full with get_package_hashes. Hashing runs on a
+    thread pool. Hardlinks to the same file are reported once and
+    symlinks are skipped.
+
+    Args:
+
+        paths (list): Files and directories to search
+
+    Kwargs:
+
+        min_size (int): Ignore files smaller than this
+
+        partial_size (int): Bytes hashed from each end of a file before
+                            hashing all of it
+
+        workers (int): Number of threads
+
+    Returns:
+
+        (list): Lists of DuplicateFile with the same contents, two or
+                more each, sorted by path, largest files first
+    """
+    by_size = collections.defaultdict(list)
+    seen = set()
+    stack = [os.path.abspath(os.fspath(p)) for p in paths]
+    while stack:
+        path = stack.pop()
+        try:
+            st = os.lstat(path)
+        except OSError as err:
+            log.debug(err, exc_info=True)
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                with os.scandir(path) as it:
+                    stack.extend(entry.path for entry in it)
+            except OSError as err:
+                log.debug(err, exc_info=True)
+            continue
+        if not stat.S_ISREG(st.st_mode) or st.st_size < min_size:
+            continue
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        by_size[st.st_size].append(
+            DuplicateFile(path, st.st_size, st.st_mtime_ns, st.st_ino)
+        )
+
+    candidates = [
+        (size, group) for size, group in by_size.items() if len(group) > 1
+    ]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        candidates = _regroup(
+            pool, lambda path: get_partial_hash(path, partial_size), candidates
+        )
+        # Files no bigger than both ends were hashed whole already
+        done = [g for g in candidates if g[0] <= partial_size * 2]
+        candidates = _regroup(
+            pool,
+            get_package_hashes,
+            [g for g in candidates if g[0] > partial_size * 2],
+        )
+    groups = sorted(done + candidates, key=lambda g: g[0], reverse=True)
+    return [sorted(group) for _, group in groups]
+
+
+def _regroup(pool, key_func, groups):
+    # Splits each (size, files) group by key_func(path), keeping groups
+    # of two or more. Files that can't be read are dropped.
+    files = [f for _, group in groups for f in group]
+    keys = [key for key, group in groups for _ in group]
+    futures = [pool.submit(key_func, f.path) for f in files]
+    regrouped = collections.defaultdict(list)
+    for key, f, future in zip(keys, files, futures):
+        try:
+            regrouped[(key, future.result())].append(f)
+        except OSError as err:
+            log.debug(err, exc_info=True)
+    return [(k[0], g) for k, g in regrouped.items() if len(g) > 1]
+
+
+def link_duplicates(groups, same_metadata=True):
+    """Replaces duplicate files with hardlinks to the first unchanged
+    file of their group.
+
+    Each duplicate is replaced atomically by linking to a temporary name
+    next to it and renaming that over it. Files whose size, mtime or
+    inode changed since find_duplicates are left alone, as are files
+    that can't be linked, e.g. because they're on another file system.
+    A file changed between that check and the rename is still replaced.
+
+    Hardlinks share their permissions, owner and times, so a replaced
+    duplicate takes those of the file it's linked to.
+
+    Args:
+
+        groups (list): Lists of DuplicateFile, as returned by
+                       find_duplicates
+
+    Kwargs:
+
+        same_metadata (bool): Only replace duplicates whose permissions
+                              and owner match the kept file
+
+    Returns:
+
+        (int): Number of files replaced
+    """
+    replaced = 0
+    for group in groups:
+        current = []
+        for dup in group:
+            st = _unchanged_stat(dup)
+            if st is not None:
+                current.append((dup, st))
+        if len(current) < 2:
+            continue
+        keep, keep_st = current[0][0].path, current[0][1]
+        for dup, st in current[1:]:
+            if same_metadata and (st.st_mode, st.st_uid, st.st_gid) != (
+                    keep_st.st_mode, keep_st.st_uid, keep_st.st_gid):
+                log.debug("Metadata differs from %s: %s", keep, dup.path)
+                continue
+            path = dup.path
+            temp = "{}.{}.link".format(path, uuid.uuid4().hex)
+            try:
+                os.link(keep, temp)
+            except OSError as err:
+                log.debug(err, exc_info=True)
+                continue
+            try:
+                os.replace(temp, path)
+            except OSError as err:
+                log.debug(err, exc_info=True)
+                _unlink_quietly(temp)
+                continue
+            replaced += 1
+    return replaced
+
+
+def _unchanged_stat(dup):
+    # Returns the file's stat if it's still what find_duplicates saw
+    try:
+        st = os.lstat(dup.path)
+    except OSError as err:
+        log.debug(err, exc_info=True)
+        return None
+    if (st.st_size, st.st_mtime_ns, st.st_ino) != dup[1:]:
+        log.debug("Changed since find_duplicates: %s", dup.path)
+        return None
+    return st
+
+
+def atomic_write(path, data, encoding="utf-8", fsync=True):
+    """Writes a file so readers see either the old or the new contents.
+
+    data is written to a temporary file in the same directory, which
+    then replaces path with os.replace. To write many files, use
+    AtomicWriteBatch, which syncs them all at once.
+
+    Args:
+
+        path (str): File to write
+
+        data (bytes/str): Contents, str is encoded with encoding
+
+    Kwargs:
+
+        encoding (str): Encoding for str data
+
+        fsync (bool): Flush the file and its directory to disk so the
+                      write survives a crash
+    """
+    path = os.path.abspath(os.fspath(path))
+    tmp = _write_temp(path, data, encoding, fsync)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        _unlink_quietly(tmp)
+        raise
+    if fsync:
+        _fsync_dir(os.path.dirname(path))
+
+
+class AtomicWriteBatch(object):
+    """Atomic writes of many files with one round of syncing.
+
+    Each write goes to a temporary file right away. commit() fsyncs all
+    of them, concurrently, replaces the targets and then fsyncs each
+    directory once. Durability costs one fsync per file plus one per
+    directory, instead of a file and a directory fsync for every file.
+    Leaving the with block without an error commits, an error aborts
+    and removes the temporary files. Example usage::
+
+        with AtomicWriteBatch() as batch:
+            for name, data in manifests.items():
+                batch.write(name, data)
+
+    Kwargs:
+
+        fsync (bool): Sync files and directories at commit
+
+        workers (int): Threads issuing file fsyncs
+    """
+
+    def __init__(self, fsync=True, workers=8):
+        self.fsync = fsync
+        self.workers = workers
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(self, path, data, encoding="utf-8"):
+        """Stages a write, see atomic_write"""
+        path = os.path.abspath(os.fspath(path))
+        # The mode is copied at commit, after the fsync, which needs to
+        # open the file and couldn't if it became read only
+        tmp = _write_temp(path, data, encoding, False, copy_mode=False)
+        self._pending.append((tmp, path))
+
+    def commit(self):
+        """Syncs and moves every staged file into place"""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            if self.fsync:
+                with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+                    list(pool.map(_fsync_file, [tmp for tmp, _ in pending]))
+            for tmp, path in pending:
+                _copy_mode(path, tmp)
+                os.replace(tmp, path)
+        except BaseException:
+            for tmp, _ in pending:
+                _unlink_quietly(tmp)
+            raise
+        if self.fsync:
+            for directory in sorted(set(os.path.dirname(p) for _, p in pending)):
+                _fsync_dir(directory)
+
+    def abort(self):
+        """Removes every staged file"""
+        pending, self._pending = self._pending, []
+        for tmp, _ in pending:
+            _unlink_quietly(tmp)
+
+
+def _write_temp(path, data, encoding, fsync, copy_mode=True):
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, ".{}.{}.tmp".format(name, uuid.uuid4().hex[:12]))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    # 0o666 so the file gets the same permissions open() would give it
+    fd = os.open(tmp, flags, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if copy_mode:
+            _copy_mode(path, tmp)
+    except BaseException:
+        _unlink_quietly(tmp)
+        raise
+    return tmp
+
+
+def _copy_mode(path, tmp):
+    # Keeps the permissions of the file being replaced, if there is one
+    try:
+        shutil.copymode(path, tmp)
+    except OSError:
+        pass
+
+
+def _fsync_file(path):
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path):
+    # Directories can't be opened, let alone synced, on Windows
+    if sys.platform == "win32":
+        return
+    fd = os.open(path, _DIR_FD_FLAGS)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError as err:
+        log.debug(err, exc_info=True)
+
+
+def remove_later(path, trash_dir=None):
+    """Removes path on a background thread.
+
+    path is renamed into a trash directory on the same file system,
+    which is atomic and takes the same time for any tree size, and then
+    deleted on a background thread. Anything left in the trash directory
+    from an earlier run is deleted too, the first time it's used. If the
+    rename fails, e.g. the trash directory is on another file system,
+    path is removed right away with remove_any.
+
+    The worker is a daemon thread, so exiting doesn't wait for it and
+    whatever is left is picked up by the next run. Call empty_trash at
+    startup to clean up without removing anything new.
+
+    Args:
+
+        path (str): File or directory to remove
+
+    Kwargs:
+
+        trash_dir (str): Trash directory. Defaults to TRASH_DIR_NAME in
+                         the parent directory of path.
+
+    Returns:
+
+        (concurrent.futures.Future): Resolves to a RemoveStats once the
+                                     trash entry is deleted
+    """
+    path = os.path.abspath(os.fspath(path))
+    if trash_dir is None:
+        trash_dir = os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+    trash_dir = os.path.abspath(os.fspath(trash_dir))
+
+    if not os.path.lexists(path):
+        future = concurrent.futures.Future()
+        future.set_result(RemoveStats(0, 0, 0, 0))
+        return future
+
+    target = os.path.join(
+        trash_dir, "{}-{}".format(uuid.uuid4().hex, os.path.basename(path))
+    )
+    if not _move_to_trash(path, target, trash_dir):
+        future = concurrent.futures.Future()
+        future.set_result(remove_any(path, workers=8))
+        return future
+    future = _queue_trash_job(_remove_trash_entry, target, trash_dir)
+
+    with _trash_lock:
+        first_use = trash_dir not in _trash_dirs_seen
+        _trash_dirs_seen.add(trash_dir)
+    if first_use:
+        empty_trash(trash_dir)
+    return future
+
+
+def swap_dirs(path1, path2):
+    """Exchanges two directories, or any two paths on the same file
+    system.
+
+    On Linux 3.15+ this is one renameat2(RENAME_EXCHANGE) call, so
+    anyone opening either path sees the old or the new tree and never
+    nothing. Elsewhere, or when the file system doesn't support it,
+    path1 is renamed to a temporary name next to it and there's a short
+    window where path1 doesn't exist.
+
+    Args:
+
+        path1 (str): First path
+
+        path2 (str): Second path
+
+    Returns:
+
+        (bool): True if the exchange was atomic
+    """
+    path1 = os.fspath(path1)
+    path2 = os.fspath(path2)
+    if _rename_exchange(path1, path2):
+        return True
+    temp = "{}.{}.swap".format(path1, uuid.uuid4().hex)
+    os.rename(path1, temp)
+    try:
+        os.rename(path2, path1)
+    except OSError:
+        os.rename(temp, path1)
+        raise
+    os.rename(temp, path2)
+    return False
+
+
+def replace_dir(path, new_path, trash_dir=None):
+    """Moves new_path into place at path and removes the old tree on a
+    background thread.
+
+    The old and new trees are exchanged with swap_dirs, so path is
+    never missing where renameat2 is available. Otherwise path is
+    renamed aside and new_path into its place right after, and if that
+    fails the old tree is put back. Either way nothing is deleted before
+    returning. Both paths must be on the same file system.
+
+    Args:
+
+        path (str): Directory to replace, needn't exist
+
+        new_path (str): Directory to put in its place
+
+    Kwargs:
+
+        trash_dir (str): Passed to remove_later
+
+    Returns:
+
+        (concurrent.futures.Future): Resolves to a RemoveStats once the
+                                     old tree is deleted
+    """
+    path = os.path.abspath(os.fspath(path))
+    new_path = os.path.abspath(os.fspath(new_path))
+    if not os.path.lexists(path):
+        os.rename(new_path, path)
+        future = concurrent.futures.Future()
+        future.set_result(RemoveStats(0, 0, 0, 0))
+        return future
+    if _rename_exchange(new_path, path):
+        return remove_later(new_path, trash_dir)
+    # The old tree is only given up once the new one is in place
+    old = "{}.{}.old".format(path, uuid.uuid4().hex)
+    os.rename(path, old)
+    try:
+        os.rename(new_path, path)
+    except OSError:
+        os.rename(old, path)
+        raise
+    return remove_later(old, trash_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_renameat2():
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (AttributeError, OSError):
+        # glibc before 2.28
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                     ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+def _rename_exchange(path1, path2):
+    # Returns False if the platform or file system can't exchange
+    renameat2 = _load_renameat2()
+    if renameat2 is None:
+        return False
+    import ctypes
+
+    if renameat2(_AT_FDCWD, os.fsencode(path1), _AT_FDCWD,
+                 os.fsencode(path2), RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL):
+        log.debug("renameat2 exchange unsupported: %s", os.strerror(err))
+        return False
+    raise OSError(err, os.strerror(err), path1, None, path2)
+
+
+def _move_to_trash(path, target, trash_dir):
+    # The worker removes the trash directory once it's empty, which can
+    # happen between makedirs and rename, so that's retried
+    for _ in range(3):
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+            os.rename(path, target)
+        except FileNotFoundError as err:
+            log.debug(err, exc_info=True)
+            if not os.path.lexists(path):
+                return False
+        except OSError as err:
+            log.debug(err, exc_info=True)
+            return False
+        else:
+            return True
+    return False
+
+
+def empty_trash(trash_dir):
+    """Deletes everything in a trash directory on the background thread.
+
+    Args:
+
+        trash_dir (str): Trash directory, see remove_later
+
+    Returns:
+
+        (concurrent.futures.Future): Resolves to a RemoveStats once the
+                                     trash directory is empty
+    """
+    return _queue_trash_job(_empty_trash, os.fspath(trash_dir))
+
+
+def _queue_trash_job(func, *args):
+    global _trash_worker
+    future = concurrent.futures.Future()
+    _trash_queue.put((future, func, args))
+    with _trash_lock:
+        if _trash_worker is None or not _trash_worker.is_alive():
+            _trash_worker = threading.Thread(
+                target=_run_trash_jobs, name="dsdev-trash"
+            )
+            _trash_worker.daemon = True
+            _trash_worker.start()
+    return future
+
+
+def _run_trash_jobs():
+    while True:
+        future, func, args = _trash_queue.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(func(*args))
+        except Exception as err:  # pragma: no cover
+            log.debug(err, exc_info=True)
+            future.set_exception(err)
+
+
+def _remove_trash_entry(path, trash_dir):
+    stats = remove_tree(path, workers=2)
+    # Only goes away once nothing else is in it
+    _remove_dir(trash_dir)
+    return stats
+
+
+def _empty_trash(trash_dir):
+    try:
+        entries = os.listdir(trash_dir)
+    except OSError:
+        return RemoveStats(0, 0, 0, 0)
+    totals = [0, 0, 0, 0]
+    for name in entries:
+        stats = remove_tree(os.path.join(trash_dir, name), workers=2)
+        totals = [a + b for a, b in zip(totals, stats)]
+    _remove_dir(trash_dir)
+    return RemoveStats(*totals)
+
+
 class ChDir(object):
     def __init__(self, path):
         self.old_dir = os.getcwd()
@@ -84,3 +1109,84 @@ class ChDir(object):
     def __exit__(self, *args, **kwargs):
         log.debug("Moving back to Directory --> {}".format(self.old_dir))
         os.chdir(self.old_dir)
+
+
+class WorkDir(object):
+    """Thread safe alternative to ChDir.
+
+    Instead of changing the process wide working directory with
+    os.chdir, the directory is tracked in a context variable, so every
+    thread (and asyncio task) can be inside its own directory. Only the
+    helpers in this module respect it: get_cwd, resolve_path, cwd_open,
+    cwd_scandir and cwd_run. Relative paths given to WorkDir resolve
+    against the enclosing WorkDir.
+
+    Where supported, a file descriptor for the directory is held while
+    inside, and cwd_open opens files relative to it, so it keeps working
+    if the directory is renamed.
+
+    Args:
+
+        path (str): Directory to work in
+    """
+
+    def __init__(self, path):
+        self.new_dir = path
+
+    def __enter__(self):
+        path = resolve_path(self.new_dir)
+        if not os.path.isdir(path):
+            raise NotADirectoryError(path)
+        fd = os.open(path, _DIR_FD_FLAGS) if _USE_DIR_FD else None
+        log.debug("Working in Directory --> {}".format(path))
+        # Each entry's state lives in the context variable, so one
+        # instance can be entered from many threads or re-entered
+        _work_dir.set((path, fd, _work_dir.get()))
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        path, fd, previous = _work_dir.get()
+        _work_dir.set(previous)
+        if fd is not None:
+            os.close(fd)
+
+
+def get_cwd():
+    """Returns the working directory of the current WorkDir
+
+    Falls back to os.getcwd() outside of a WorkDir.
+    """
+    work_dir = _work_dir.get()
+    if work_dir is None:
+        return os.getcwd()
+    return work_dir[0]
+
+
+def resolve_path(path):
+    """Returns path made absolute against get_cwd()"""
+    return os.path.join(get_cwd(), os.fspath(path))
+
+
+def cwd_open(path, *args, **kwargs):
+    """Like open, with relative paths resolved against get_cwd()"""
+    path = os.fspath(path)
+    work_dir = _work_dir.get()
+    if work_dir is None or work_dir[1] is None or os.path.isabs(path):
+        return open(resolve_path(path), *args, **kwargs)
+    fd = work_dir[1]
+
+    def opener(name, flags):
+        return os.open(name, flags, dir_fd=fd)
+
+    return open(path, *args, opener=opener, **kwargs)
+
+
+def cwd_scandir(path="."):
+    """Like os.scandir, with relative paths resolved against get_cwd()"""
+    return os.scandir(resolve_path(path))
+
+
+def cwd_run(*args, **kwargs):
+    """Like subprocess.run, running in get_cwd() unless cwd is given"""
+    kwargs["cwd"] = resolve_path(kwargs.get("cwd") or ".")
+    return subprocess.run(*args, **kwargs)
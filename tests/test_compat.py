@@ -21,9 +21,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import codecs
 import logging
 
-from dsdev_utils.compat import make_compat_str
+from dsdev_utils import compat
+from dsdev_utils.compat import (CHARSET_BACKEND_ENV, TIER_BOM, TIER_CHARDET,
+                                TIER_CHARDET_FULL, TIER_UTF8, StreamDecoder,
+                                CharsetBackend, available_charset_backends,
+                                decode_batch, detect_and_decode, get_charset_backend,
+                                iter_decode, make_compat_str,
+                                set_charset_backend)
+import pytest
 
 log = logging.getLogger()
 
@@ -32,3 +40,197 @@ def test_make_compat_str():
     byte_str = b"Give me some bytes"
     assert isinstance(make_compat_str(byte_str), str)
     assert isinstance(make_compat_str("Another string".encode()), str)
+
+
+def test_detect_utf8():
+    assert detect_and_decode(b"plain") == ("plain", "ascii", TIER_UTF8)
+    text = "Grüße, 世界"
+    assert detect_and_decode(text.encode("utf-8")) == (text, "utf-8", TIER_UTF8)
+
+
+@pytest.mark.parametrize("encoding, bom", [
+    ("utf-8", codecs.BOM_UTF8),
+    ("utf-16-le", codecs.BOM_UTF16_LE),
+    ("utf-16-be", codecs.BOM_UTF16_BE),
+    ("utf-32-le", codecs.BOM_UTF32_LE),
+    ("utf-32-be", codecs.BOM_UTF32_BE),
+])
+def test_detect_bom(encoding, bom):
+    text = "Give me some bytes"
+    result = detect_and_decode(bom + text.encode(encoding))
+    assert result.text == text
+    assert result.tier == TIER_BOM
+    assert make_compat_str(bom + text.encode(encoding)) == text
+
+
+def test_detect_chardet():
+    text = "Le café est très bon, à bientôt. " * 20
+    result = detect_and_decode(text.encode("cp1252"))
+    assert result.text == text
+    assert result.tier == TIER_CHARDET
+
+
+def test_detect_chardet_full_when_sample_misleads():
+    data = b"ascii only " * 100 + "café".encode("latin-1")
+    result = detect_and_decode(data, sample_size=64)
+    assert result.tier == TIER_CHARDET_FULL
+    assert result.text.endswith("caf\xe9")
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("encoding, bom", [
+    ("utf-8", codecs.BOM_UTF8),
+    ("utf-16-le", codecs.BOM_UTF16_LE),
+    ("utf-16-be", codecs.BOM_UTF16_BE),
+    ("utf-32-le", codecs.BOM_UTF32_LE),
+    ("utf-32-be", codecs.BOM_UTF32_BE),
+])
+@pytest.mark.parametrize("size", [1, 2, 3, 5])
+def test_stream_bom(encoding, bom, size):
+    text = "Grüße, 世界 " * 50
+    data = bom + text.encode(encoding)
+    decoder = StreamDecoder()
+    out = "".join(decoder.feed(c) for c in chunked(data, size))
+    assert out + decoder.close() == text
+    assert decoder.tier == TIER_BOM
+
+
+@pytest.mark.parametrize("backend", available_charset_backends())
+def test_stream_split_utf32_bom(backend):
+    data = "héllo".encode("utf-32")
+    for split in (2, 3):
+        chunks = [data[:split], data[split:]]
+        assert "".join(iter_decode(chunks, backend=backend)) == "héllo"
+
+
+def test_stream_utf8():
+    text = "Grüße, 世界 " * 1000
+    chunks = chunked(text.encode("utf-8"), 7)
+    assert "".join(iter_decode(chunks, sample_size=1024)) == text
+
+    decoder = StreamDecoder()
+    assert decoder.feed(b"short") == ""
+    assert decoder.close() == "short"
+    assert decoder.encoding == "ascii"
+    assert decoder.tier == TIER_UTF8
+
+
+def test_stream_chardet():
+    text = "Le café est très bon, à bientôt. " * 500
+    decoder = StreamDecoder(sample_size=4096)
+    out = []
+    for chunk in chunked(text.encode("cp1252"), 100):
+        out.append(decoder.feed(chunk))
+        # Memory stays bounded by the sample size
+        assert len(decoder._buffer) < 4096 + 100
+    out.append(decoder.close())
+    assert "".join(out) == text
+    assert decoder.tier == TIER_CHARDET
+
+
+def test_stream_empty():
+    assert list(iter_decode([])) == []
+
+
+@pytest.mark.parametrize("backend", available_charset_backends())
+def test_charset_backends(backend):
+    text = "Le café est très bon, à bientôt. Ça coûte cher. " * 20
+    data = text.encode("cp1252")
+    result = detect_and_decode(data, backend=backend)
+    assert result.text == text
+    assert result.tier == TIER_CHARDET
+    chunks = chunked(data, 100)
+    assert "".join(iter_decode(chunks, sample_size=512, backend=backend)) == text
+
+
+def test_charset_backend_selection(monkeypatch):
+    assert "chardet" in available_charset_backends()
+    assert get_charset_backend().name == available_charset_backends()[0]
+
+    monkeypatch.setenv(CHARSET_BACKEND_ENV, "chardet")
+    assert get_charset_backend().name == "chardet"
+    monkeypatch.delenv(CHARSET_BACKEND_ENV)
+
+    set_charset_backend("chardet")
+    try:
+        assert get_charset_backend().name == "chardet"
+    finally:
+        set_charset_backend(None)
+
+    with pytest.raises(ValueError):
+        get_charset_backend("not-a-backend")
+
+
+def test_charset_backend_availability_cached(monkeypatch):
+    import importlib.util
+    find_spec = importlib.util.find_spec
+    calls = []
+
+    def counting_find_spec(name, *args):
+        calls.append(name)
+        return find_spec(name, *args)
+
+    set_charset_backend(None)
+    monkeypatch.setattr(importlib.util, "find_spec", counting_find_spec)
+    backend = get_charset_backend()
+    probes = len(calls)
+    assert 1 <= probes <= len(compat.CHARSET_BACKENDS)
+    for _ in range(10):
+        assert get_charset_backend() is backend
+        available_charset_backends()
+    assert len(calls) == len(compat.CHARSET_BACKENDS)
+
+    set_charset_backend(None)
+    get_charset_backend()
+    assert len(calls) == len(compat.CHARSET_BACKENDS) + probes
+
+
+class CountingBackend(CharsetBackend):
+    def __init__(self):
+        super(CountingBackend, self).__init__("counting", "chardet")
+        self.calls = 0
+
+    def detect(self, data):
+        self.calls += 1
+        return get_charset_backend("chardet").detect(data)
+
+
+def test_decode_batch_caches_per_source(monkeypatch):
+    backend = CountingBackend()
+    monkeypatch.setitem(compat.CHARSET_BACKENDS, "counting", backend)
+    french = "Le café est très bon, à bientôt. Ça coûte cher. " * 5
+    russian = "Съешь же ещё этих мягких французских булок. " * 5
+    payloads = []
+    sources = []
+    for i in range(10):
+        payloads += [french.encode("cp1252"), russian.encode("koi8-r"),
+                     "plain {}".format(i).encode()]
+        sources += ["fr", "ru", "ascii"]
+    cache = {}
+    result = decode_batch(payloads, sources=sources, processes=1,
+                          encoding_cache=cache, backend="counting")
+    assert result == [p.decode(e) for p, e in zip(
+        payloads, ["cp1252", "koi8-r", "ascii"] * 10)]
+    assert backend.calls == 2
+    assert set(cache) == {"fr", "ru"}
+
+    decode_batch(payloads, sources=sources, processes=1,
+                 encoding_cache=cache, backend="counting")
+    assert backend.calls == 2
+
+
+def test_decode_batch_pool():
+    texts = ["Grüße {} aus München, schöne Straße. ".format(i) * 3
+             for i in range(40)]
+    payloads = [t.encode("cp1252") for t in texts]
+    payloads.append(codecs.BOM_UTF16_LE + "bom".encode("utf-16-le"))
+    texts.append("bom")
+    assert decode_batch(payloads, processes=2) == texts
+
+
+def test_decode_batch_length_mismatch():
+    with pytest.raises(ValueError):
+        decode_batch([b"a"], sources=[])
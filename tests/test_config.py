@@ -21,9 +21,18 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import copy
+import gc
+import json
 import logging
+import os
+import pickle
+import threading
+import weakref
 
-from dsdev_utils.config import ConfigDict
+from dsdev_utils.config import (AcyclicConfigDict, ConfigDict, ConfigFile,
+                                FrozenConfig, LayeredConfig)
+import pytest
 
 log = logging.getLogger()
 
@@ -35,3 +44,258 @@ def test_config_dict():
     assert config["APP_NAME"] == "test"
     assert config["COMPANY_NAME"] == "acme"
     assert "bad_config" not in config.keys()
+
+
+class BaseConfig(object):
+    APP_NAME = "test"
+    lower = "ignored"
+
+
+class ChildConfig(BaseConfig):
+    COMPANY_NAME = "acme"
+
+
+def test_from_object():
+    config = ConfigDict()
+    config.from_object(ChildConfig)
+    assert config == {"APP_NAME": "test", "COMPANY_NAME": "acme"}
+
+    obj = ChildConfig()
+    obj.APP_NAME = "instance"
+    obj.EXTRA = 1
+    config = ConfigDict()
+    config.from_object(obj)
+    assert config == {"APP_NAME": "instance", "COMPANY_NAME": "acme", "EXTRA": 1}
+
+
+def test_from_object_class_changes():
+    class Config(object):
+        APP_NAME = "test"
+
+    config = ConfigDict()
+    config.from_object(Config)
+    Config.APP_NAME = "changed"
+    Config.NEW_KEY = True
+    config.from_object(Config)
+    assert config == {"APP_NAME": "changed", "NEW_KEY": True}
+
+    del Config.NEW_KEY
+    config = ConfigDict()
+    config.from_object(Config())
+    assert config == {"APP_NAME": "changed"}
+
+    # Same number of attributes, different names
+    del Config.APP_NAME
+    Config.RENAMED = 2
+    config = ConfigDict()
+    config.from_object(Config)
+    assert config == {"RENAMED": 2}
+
+
+def test_update():
+    config = ConfigDict()
+    config.update({"APP_NAME": "test", "bad_config": "bad"})
+    assert config == {"APP_NAME": "test"}
+
+
+def test_acyclic_config_dict():
+    config = AcyclicConfigDict(default={"APP_NAME": "test", "bad": "bad"})
+    config.from_object(ChildConfig)
+    assert config.APP_NAME == "test"
+    assert config.COMPANY_NAME == "acme"
+    assert "bad" not in config.keys()
+
+    config.MAX_RETRIES = 3
+    assert config["MAX_RETRIES"] == 3
+    del config.MAX_RETRIES
+    assert "MAX_RETRIES" not in config
+    with pytest.raises(AttributeError):
+        config.MAX_RETRIES
+
+
+def test_acyclic_config_dict_freed_on_last_reference():
+    gc.disable()
+    try:
+        config = AcyclicConfigDict(default={"APP_NAME": "test"})
+        config.COMPANY_NAME = "acme"
+        ref = weakref.ref(config)
+        del config
+        assert ref() is None
+    finally:
+        gc.enable()
+
+
+def test_layered_config():
+    defaults = ConfigDict(default={"APP_NAME": "test", "RETRIES": 1})
+    site = {"RETRIES": 2, "lower": "hidden"}
+    tenant = {"COMPANY_NAME": "acme"}
+    config = LayeredConfig(tenant, site, defaults)
+
+    assert config.APP_NAME == "test"
+    assert config["RETRIES"] == 2
+    assert "lower" not in config
+    assert config.get("lower") is None
+    with pytest.raises(KeyError):
+        config["lower"]
+    with pytest.raises(AttributeError):
+        config.lower
+    assert sorted(config) == ["APP_NAME", "COMPANY_NAME", "RETRIES"]
+    assert len(config) == 3
+
+    # Layers are referenced, not copied
+    site["RETRIES"] = 5
+    assert config.RETRIES == 5
+
+    config.TIMEOUT = 10
+    config.update({"DEBUG": True, "skip": 1})
+    assert tenant == {"COMPANY_NAME": "acme", "TIMEOUT": 10, "DEBUG": True}
+
+    child = config.new_child()
+    child.RETRIES = 9
+    assert child.RETRIES == 9
+    assert config.RETRIES == 5
+
+
+def test_layered_config_snapshot():
+    config = LayeredConfig({"A_KEY": 1}, {"A_KEY": 2, "B_KEY": 3, "c": 4})
+    snapshot = config.snapshot()
+    assert isinstance(snapshot, ConfigDict)
+    assert snapshot == {"A_KEY": 1, "B_KEY": 3}
+    assert snapshot.B_KEY == 3
+
+
+def test_layered_config_non_string_keys():
+    config = LayeredConfig({1: "a", "A_KEY": 1})
+    config.update({2: "b", "B_KEY": 2})
+    assert config.snapshot() == {"A_KEY": 1, "B_KEY": 2}
+
+
+def test_from_file_json(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"APP_NAME": "test", "lower": 1}))
+    config = ConfigDict()
+    assert config.from_file(str(path)) is True
+    assert config == {"APP_NAME": "test"}
+    assert config.from_file(str(path)) is False
+
+
+def test_from_file_ini(tmp_path):
+    path = tmp_path / "config.ini"
+    path.write_text("[DEFAULT]\nAPP_NAME = test\n\n[UPDATES]\nChannel = beta\n")
+    config = ConfigDict()
+    config.from_file(str(path))
+    assert config == {"APP_NAME": "test", "UPDATES": {"Channel": "beta"}}
+
+
+def test_from_file_toml(tmp_path):
+    try:
+        import tomllib  # noqa: F401
+    except ImportError:
+        pytest.importorskip("tomli")
+    path = tmp_path / "config.toml"
+    path.write_text('APP_NAME = "test"\nRETRIES = 3\n')
+    config = ConfigDict()
+    config.from_file(str(path))
+    assert config == {"APP_NAME": "test", "RETRIES": 3}
+
+
+def test_from_file_unsupported(tmp_path):
+    with pytest.raises(ValueError):
+        ConfigDict().from_file(str(tmp_path / "config.yaml"))
+
+
+def test_config_file_reparses_only_on_change(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text('{"APP_NAME": "one"}')
+    parsed = []
+
+    def loader(text):
+        parsed.append(text)
+        return json.loads(text)
+
+    config_file = ConfigFile(str(path), loader=loader)
+    assert config_file.data == {"APP_NAME": "one"}
+    assert config_file.check() is False
+
+    # Same contents with a new mtime is read and hashed but not parsed
+    st = os.stat(str(path))
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert config_file.check() is False
+    assert len(parsed) == 1
+
+    path.write_text('{"APP_NAME": "two!"}')
+    assert config_file.check() is True
+    assert config_file.data == {"APP_NAME": "two!"}
+    assert len(parsed) == 2
+
+
+def test_config_file_watch(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text('{"APP_NAME": "one"}')
+    config_file = ConfigFile(str(path))
+    config_file.check()
+    changed = threading.Event()
+    stop = config_file.watch(lambda f: changed.set(), interval=0.01)
+    try:
+        path.write_text('{"APP_NAME": "changed"}')
+        assert changed.wait(5)
+        assert config_file.data == {"APP_NAME": "changed"}
+    finally:
+        stop.set()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("DSTEST_APP_NAME", "test")
+    monkeypatch.setenv("DSTEST_RETRIES", "3")
+    monkeypatch.setenv("OTHER_KEY", "x")
+    config = ConfigDict()
+    config.from_env("DSTEST_")
+    assert config == {"APP_NAME": "test", "RETRIES": 3}
+
+
+def test_freeze():
+    config = ConfigDict(default={"APP_NAME": "test", "RETRIES": 3})
+    config.lower = "skipped"
+    frozen = config.freeze()
+    assert isinstance(frozen, FrozenConfig)
+    assert frozen.APP_NAME == "test"
+    assert frozen["RETRIES"] == 3
+    assert "lower" not in frozen
+    assert sorted(frozen) == ["APP_NAME", "RETRIES"]
+    assert frozen == {"APP_NAME": "test", "RETRIES": 3}
+    assert frozen.get("MISSING", 1) == 1
+    assert not hasattr(frozen, "__dict__")
+
+    with pytest.raises(AttributeError):
+        frozen.APP_NAME = "changed"
+    with pytest.raises(AttributeError):
+        frozen.NEW_KEY = 1
+    with pytest.raises(AttributeError):
+        del frozen.APP_NAME
+
+    # Snapshot doesn't follow later changes
+    config.APP_NAME = "changed"
+    assert frozen.APP_NAME == "test"
+    assert type(config.freeze()) is type(frozen)
+
+
+def test_freeze_copy_and_pickle():
+    frozen = ConfigDict(default={"APP_NAME": "test", "RETRIES": 3}).freeze()
+    assert copy.copy(frozen) is frozen
+    assert copy.deepcopy({"config": frozen})["config"] is frozen
+    loaded = pickle.loads(pickle.dumps(frozen))
+    assert isinstance(loaded, FrozenConfig)
+    assert type(loaded) is type(frozen)
+    assert loaded == frozen
+
+
+def test_freeze_bad_key():
+    config = ConfigDict()
+    config["1ST"] = 1
+    with pytest.raises(ValueError):
+        config.freeze()
+
+    config = ConfigDict()
+    config["__PRIVATE"] = 1
+    with pytest.raises(ValueError):
+        config.freeze()
@@ -25,7 +25,7 @@ from __future__ import unicode_literals
 import io
 import logging
 
-from dsdev_utils.crypto import get_package_hashes
+from dsdev_utils.crypto import get_package_hashes, get_partial_hash
 
 log = logging.getLogger()
 
@@ -36,3 +36,18 @@ def test_package_hash():
 
     digest = "cb44ec613a594f3b20e46b768c5ee780e0a9b66ac" "6d5ac1468ca4d3635c4aa9b"
     assert digest == get_package_hashes("hash-test.txt")
+
+
+def test_partial_hash(cleandir):
+    with open("small", "wb") as f:
+        f.write(b"0123456789")
+    assert get_partial_hash("small", 5) == get_package_hashes("small")
+    assert get_partial_hash("small", 4) != get_package_hashes("small")
+
+    with open("a", "wb") as f:
+        f.write(b"head" + b"a" * 100 + b"tail")
+    with open("b", "wb") as f:
+        f.write(b"head" + b"b" * 100 + b"tail")
+    assert get_partial_hash("a", 4) == get_partial_hash("b", 4)
+    assert get_partial_hash("a", 5) != get_partial_hash("b", 5)
+    assert get_package_hashes("a") != get_package_hashes("b")
@@ -21,9 +21,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ------------------------------------------------------------------------------
+import collections
 import logging
+import sys
+import threading
+import time
 
-from dsdev_utils.helpers import EasyAccessDict, Version
+from dsdev_utils.helpers import (EasyAccessDict, Version,
+                                 format_lazy_import_report, lazy_attr,
+                                 lazy_import, lazy_import_report,
+                                 lazy_module, merge_dicts,
+                                 prefetch_lazy_imports)
 import pytest
 
 log = logging.getLogger()
@@ -127,9 +135,198 @@ class TestVersion(object):
         assert Version('1.2.3').version_str == '(1, 2, 3, 2, 0)'
 
 
+class TestLazyImport(object):
+    def test_lazy_import(self):
+        @lazy_import
+        def json():
+            import json
+            return json
+
+        assert type(json).__name__ == "_LazyImport"
+        assert json.loads("[1]") == [1]
+        assert json.__name__ == "json"
+        assert "loads" in json.__dict__
+
+    def test_loads_once_across_threads(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.05)
+            import json
+            return json
+
+        from dsdev_utils.helpers import _LazyImport
+        proxy = _LazyImport("json", loader)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(proxy.dumps)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert len(results) == 8
+        assert all(r is results[0] for r in results)
+
+    def test_report(self):
+        @lazy_import
+        def textwrap():
+            import textwrap
+            return textwrap
+
+        def entry():
+            return [r for r in lazy_import_report()
+                    if r["name"] == "textwrap"][-1]
+
+        assert entry()["resolved"] is False
+        assert entry()["module"] == __name__
+        assert "never resolved" in format_lazy_import_report()
+
+        textwrap.dedent("  x")
+        report = entry()
+        assert report["resolved"] is True
+        assert report["load_time"] >= 0
+        assert report["resolved_at"] >= 0
+        assert "test_helpers.py" in report["triggered_by"]
+        assert "test_report" in report["triggered_by"]
+        assert report["thread"] == threading.current_thread().name
+
+    def test_prefetch(self):
+        calls = []
+        loading = threading.Event()
+
+        def loader():
+            calls.append(1)
+            loading.set()
+            time.sleep(0.05)
+            import json
+            return json
+
+        from dsdev_utils.helpers import _LazyImport
+        proxy = _LazyImport("prefetch_json", loader)
+        thread = prefetch_lazy_imports()
+        assert loading.wait(10)
+        # Waits for the prefetch thread's load instead of loading again
+        assert proxy.loads("[2]") == [2]
+        thread.join()
+        assert len(calls) == 1
+        report = [r for r in lazy_import_report()
+                  if r["name"] == "prefetch_json"][-1]
+        assert report["triggered_by"] == "prefetch"
+        assert report["thread"] == thread.name
+
+    def test_registry_drops_dead_proxies(self, monkeypatch):
+        from dsdev_utils import helpers
+        monkeypatch.setattr(helpers, "_lazy_import_records", [])
+        monkeypatch.setattr(helpers, "_pending_lazy_imports", [])
+        monkeypatch.setattr(helpers, "MAX_LAZY_IMPORT_RECORDS", 50)
+
+        kept = lazy_attr("json", "loads")
+        for _ in range(5000):
+            lazy_attr("json", "dumps")
+        assert len(helpers._lazy_import_records) < 200
+        assert len(helpers._pending_lazy_imports) < 200
+        assert kept._dsdev_lazy_record in helpers._lazy_import_records
+
+        for _ in range(100):
+            lazy_attr("json", "dumps")([1])
+        assert len(lazy_import_report()) == 50
+        assert kept("[1]") == [1]
+
+
+class TestLazyModule(object):
+    def test_lazy_module(self):
+        sys.modules.pop("colorsys", None)
+        colorsys = lazy_module("colorsys")
+        assert sys.modules["colorsys"] is colorsys
+        assert type(colorsys) is not type(sys)
+        assert colorsys.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+        assert type(colorsys) is type(sys)
+        assert lazy_module("colorsys") is colorsys
+
+    def test_lazy_module_dotted(self):
+        import xml.dom
+        sys.modules.pop("xml.dom.minidom", None)
+        xml.dom.__dict__.pop("minidom", None)
+        minidom = lazy_module("xml.dom.minidom")
+        import xml.dom.minidom
+        assert xml.dom.minidom is minidom
+        doc = xml.dom.minidom.parseString("<a/>")
+        assert doc.documentElement.tagName == "a"
+
+    def test_lazy_module_missing(self):
+        with pytest.raises(ImportError):
+            lazy_module("dsdev_utils_no_such_module")
+
+    def test_lazy_attr(self):
+        OrderedDict = lazy_attr("collections", "OrderedDict")
+        ascii_lowercase = lazy_attr("string", "ascii_lowercase")
+        assert isinstance(OrderedDict(a=1), OrderedDict)
+        assert issubclass(collections.OrderedDict, OrderedDict)
+        assert OrderedDict.__name__ == "OrderedDict"
+        assert list(ascii_lowercase)[:3] == ["a", "b", "c"]
+        assert "z" in ascii_lowercase
+        assert ascii_lowercase[1] == "b"
+        assert len(ascii_lowercase) == 26
+
+    def test_lazy_attr_rebinds_namespace(self):
+        namespace = {}
+        exec(
+            "from dsdev_utils.helpers import lazy_attr\n"
+            "dumps = lazy_attr('json', 'dumps')\n"
+            "alias = dumps\n",
+            namespace,
+        )
+        import json
+        assert namespace["dumps"]([1]) == "[1]"
+        assert namespace["dumps"] is json.dumps
+        assert namespace["alias"] is json.dumps
+
+
 class TestEasyAccessDict(object):
     def test_easy_access(self):
         key = "carson*da*park"
         data = {"carson": {"da": {"park": "mills"}}}
         easy_data = EasyAccessDict(data)
         assert "mills" == easy_data.get(key)
+
+
+class TestMergeDicts(object):
+    def test_merge_nested(self):
+        left = {"updates": {"mac": {"1.0": "a"}}, "keep": {"x": 1}}
+        right = {"updates": {"mac": {"1.1": "b"}, "win": {"1.1": "c"}}}
+        merged = merge_dicts(left, right)
+        assert merged == {
+            "updates": {"mac": {"1.0": "a", "1.1": "b"}, "win": {"1.1": "c"}},
+            "keep": {"x": 1},
+        }
+        assert left == {"updates": {"mac": {"1.0": "a"}}, "keep": {"x": 1}}
+        easy_data = EasyAccessDict(merged)
+        assert easy_data.get("updates*mac*1.1") == "b"
+
+    def test_merge_shares_untouched_subtrees(self):
+        left = {"keep": {"x": 1}, "both": {"a": 1}}
+        right = {"new": {"y": 2}, "both": {"b": 2}}
+        merged = merge_dicts(left, right)
+        assert merged["keep"] is left["keep"]
+        assert merged["new"] is right["new"]
+        assert merged["both"] is not left["both"]
+
+    def test_merge_conflict_policies(self):
+        left = {"latest": {"mac": "1.2.0", "win": "2.0.0"}}
+        right = {"latest": {"mac": "1.10.0", "win": "1.9.0"}}
+        assert merge_dicts(left, right, conflict="left") == left
+        assert merge_dicts(left, right, conflict="right") == right
+        assert merge_dicts(left, right, conflict="newer") == {
+            "latest": {"mac": "1.10.0", "win": "2.0.0"}
+        }
+
+    def test_merge_bad_policy(self):
+        with pytest.raises(ValueError):
+            merge_dicts({}, {}, conflict="oldest")
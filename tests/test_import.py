@@ -0,0 +1,85 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+import logging
+import os
+import subprocess
+import sys
+
+import dsdev_utils
+import pytest
+
+log = logging.getLogger()
+
+HEAVY_MODULES = ("chardet", "packaging", "deprecated", "flask")
+
+# Microseconds, as reported by -X importtime
+IMPORT_BUDGET = 20000
+
+
+def import_times(code):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(dsdev_utils.__file__))
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_skips_heavy_dependencies():
+    times = import_times("import dsdev_utils; dsdev_utils.remove_any")
+    assert "dsdev_utils.paths" in times
+    loaded = [n for n in times if n.split(".")[0] in HEAVY_MODULES]
+    assert loaded == []
+
+
+def test_import_budget():
+    times = import_times("import dsdev_utils")
+    assert "dsdev_utils._version" not in times
+    assert times["dsdev_utils"] < IMPORT_BUDGET
+
+
+def test_version():
+    from dsdev_utils._version import get_versions
+    assert dsdev_utils.__version__ == get_versions()["version"]
+    assert "__version__" in vars(dsdev_utils)
+
+
+def test_lazy_attributes():
+    from dsdev_utils.helpers import EasyAccessDict
+    assert dsdev_utils.EasyAccessDict is EasyAccessDict
+    assert dsdev_utils.paths.remove_any is dsdev_utils.remove_any
+    assert "make_compat_str" in dir(dsdev_utils)
+    with pytest.raises(AttributeError):
+        dsdev_utils.not_a_thing
@@ -0,0 +1,88 @@
+# ------------------------------------------------------------------------------
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2021 Digital Sapphire
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+import logging
+
+from dsdev_utils.manifest import (dump_manifest, dumps_manifest,
+                                  load_manifest, loads_manifest)
+import pytest
+
+log = logging.getLogger()
+
+MANIFEST = {
+    "updates": {
+        "app": {
+            "mac": {"1.0": {"file_hash": "abc", "file_size": 12}},
+            "win": {"1.0": {"file_hash": "def", "file_size": 1.5}},
+        }
+    },
+    "latest": {"app": {"stable": {"mac": "1.0", "win": "1.0"}}},
+    "misc": [1, None, True, (2, 3), {"x": b"bytes"}],
+}
+
+
+@pytest.mark.parametrize("depth", [0, 1, 2, 5])
+def test_round_trip(depth):
+    data = loads_manifest(dumps_manifest(MANIFEST, index_depth=depth))
+    assert data == MANIFEST
+    assert list(data) == list(MANIFEST)
+    assert type(data["misc"][3]) is tuple
+    assert type(data["updates"]["app"]["win"]["1.0"]["file_size"]) is float
+
+
+def test_round_trip_key_types():
+    data = {"a": {True: "t", 2: "two"}, "b": {1: "one", 2.0: "float"}}
+    loaded = loads_manifest(dumps_manifest(data, index_depth=2))
+    assert [type(k) for k in loaded["a"]] == [bool, int]
+    assert [type(k) for k in loaded["b"]] == [int, float]
+    assert loaded == data
+
+
+def test_load_key():
+    buf = dumps_manifest(MANIFEST, index_depth=2)
+    assert loads_manifest(buf, key="updates*app*mac*1.0*file_hash") == "abc"
+    assert loads_manifest(buf, key="latest*app") == MANIFEST["latest"]["app"]
+    assert loads_manifest(buf, key="updates*nope") is None
+    assert loads_manifest(buf, key="latest*app*stable*mac*x") is None
+    assert loads_manifest(buf, key="latest/app", sep="/") == {
+        "stable": {"mac": "1.0", "win": "1.0"}
+    }
+
+
+def test_bad_magic():
+    with pytest.raises(ValueError):
+        loads_manifest(b"JSON" + dumps_manifest({})[4:])
+
+
+def test_marshal_version_mismatch():
+    buf = bytearray(dumps_manifest(MANIFEST))
+    buf[5] += 1
+    with pytest.raises(ValueError):
+        loads_manifest(bytes(buf))
+
+
+def test_file(tmp_path):
+    filename = str(tmp_path / "manifest.bin")
+    dump_manifest(MANIFEST, filename)
+    assert load_manifest(filename) == MANIFEST
+    assert load_manifest(filename, key="updates*app*win*1.0*file_hash") == "def"
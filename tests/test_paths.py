@@ -29,8 +29,22 @@ except ImportError:
     from pathlib import Path
 
 import os
+import shutil
+import subprocess
+import sys
+import threading
 
-from dsdev_utils.paths import ChDir, get_mac_dot_app_dir
+from dsdev_utils import paths
+from dsdev_utils.paths import (TRASH_DIR_NAME, AtomicWriteBatch, ChDir,
+                               CopyStats, DirStats, DuplicateFile,
+                               RemoveStats, WorkDir,
+                               atomic_write, copy_file, copy_tree, cwd_open,
+                               cwd_run, cwd_scandir, empty_trash, get_cwd,
+                               find_duplicates, get_mac_dot_app_dir,
+                               link_duplicates, remove_any, remove_later,
+                               replace_dir, resolve_path, scan_tree,
+                               swap_dirs)
+import pytest
 
 
 log = logging.getLogger()
@@ -62,3 +76,469 @@ def test_chdir_pathlib(cleandir):
     with ChDir(new_dir):
         assert os.getcwd() == str(new_dir)
     assert og_dir == os.getcwd()
+
+
+def make_tree(root, dirs=3, files=4, depth=3):
+    os.makedirs(root)
+    if depth == 0:
+        return
+    for i in range(files):
+        with open(os.path.join(root, "file{}".format(i)), "wb") as f:
+            f.write(b"x" * 10)
+    for i in range(dirs):
+        make_tree(os.path.join(root, "dir{}".format(i)), dirs, files, depth - 1)
+
+
+def test_remove_any(cleandir):
+    make_tree("tree")
+    with open("single", "w") as f:
+        f.write("x")
+    assert remove_any("tree") is None
+    remove_any("single")
+    remove_any("missing")
+    assert not os.path.exists("tree")
+    assert not os.path.exists("single")
+
+
+def test_remove_any_parallel(cleandir):
+    make_tree("tree")
+    # 1 + 3 + 9 directories with files, 27 empty leaf directories
+    stats = remove_any("tree", workers=4)
+    assert stats == RemoveStats(files=52, dirs=40, bytes=520, errors=0)
+    assert not os.path.exists("tree")
+
+    with open("single", "wb") as f:
+        f.write(b"abc")
+    assert remove_any("single", workers=4) == RemoveStats(1, 0, 3, 0)
+    assert remove_any("missing", workers=4) == RemoveStats(0, 0, 0, 0)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs symlinks")
+def test_remove_any_parallel_keeps_symlink_targets(cleandir):
+    make_tree("outside", depth=1)
+    make_tree("tree", depth=1)
+    os.symlink(os.path.abspath("outside"), os.path.join("tree", "link"))
+    stats = remove_any("tree", workers=2)
+    assert stats.errors == 0
+    assert not os.path.exists("tree")
+    assert len(os.listdir("outside")) == 7
+
+
+def test_remove_later(cleandir):
+    make_tree("app-1.0", depth=2)
+    make_tree(os.path.join(TRASH_DIR_NAME, "leftover"), depth=1)
+    future = remove_later("app-1.0")
+    assert not os.path.exists("app-1.0")
+    stats = future.result(timeout=10)
+    assert stats.files == 16
+    assert stats.errors == 0
+    empty_trash(TRASH_DIR_NAME).result(timeout=10)
+    assert not os.path.exists(TRASH_DIR_NAME)
+
+    assert remove_later("missing").result(timeout=10) == RemoveStats(0, 0, 0, 0)
+
+
+def test_remove_later_trash_dir_removed(cleandir, monkeypatch):
+    make_tree("app-1.0", depth=2)
+    rename = os.rename
+    calls = []
+
+    def racing_rename(src, dst):
+        # The worker removing the empty trash dir after makedirs
+        if not calls:
+            os.rmdir(os.path.dirname(dst))
+        calls.append(src)
+        return rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", racing_rename)
+    stats = remove_later("app-1.0").result(timeout=10)
+    assert len(calls) == 2
+    assert stats.files == 16
+
+
+def test_remove_later_fallback_stats(cleandir, monkeypatch):
+    make_tree("app-1.0", depth=2)
+    monkeypatch.setattr(paths, "_move_to_trash", lambda *args: False)
+    stats = remove_later("app-1.0").result(timeout=10)
+    assert not os.path.exists("app-1.0")
+    assert stats == RemoveStats(files=16, dirs=13, bytes=160, errors=0)
+
+
+def test_empty_trash(cleandir):
+    make_tree(os.path.join("trash", "old"), depth=1)
+    stats = empty_trash("trash").result(timeout=10)
+    assert stats.files == 4
+    assert not os.path.exists("trash")
+
+
+def test_work_dir(cleandir):
+    og_dir = os.getcwd()
+    os.makedirs(os.path.join("outer", "inner"))
+    with WorkDir("outer"):
+        assert get_cwd() == os.path.join(og_dir, "outer")
+        assert os.getcwd() == og_dir
+        with WorkDir("inner"):
+            assert get_cwd() == os.path.join(og_dir, "outer", "inner")
+            with cwd_open("file.txt", "w") as f:
+                f.write("inner")
+        assert [e.name for e in cwd_scandir()] == ["inner"]
+        assert resolve_path("x") == os.path.join(og_dir, "outer", "x")
+    assert get_cwd() == og_dir
+    with open(os.path.join("outer", "inner", "file.txt")) as f:
+        assert f.read() == "inner"
+
+
+def test_work_dir_threads(cleandir):
+    og_dir = os.getcwd()
+    names = ["worker{}".format(i) for i in range(8)]
+    for name in names:
+        os.mkdir(name)
+    barrier = threading.Barrier(len(names))
+    seen = {}
+
+    def worker(name):
+        with WorkDir(name):
+            barrier.wait()
+            with cwd_open("out.txt", "w") as f:
+                f.write(name)
+            seen[name] = get_cwd()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for name in names:
+        assert seen[name] == os.path.join(og_dir, name)
+        with open(os.path.join(name, "out.txt")) as f:
+            assert f.read() == name
+
+
+def test_work_dir_shared_instance(cleandir):
+    os.mkdir("shared")
+    work_dir = WorkDir(os.path.abspath("shared"))
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def worker(i):
+        try:
+            with work_dir:
+                barrier.wait()
+                with work_dir:
+                    with cwd_open("out{}.txt".format(i), "w") as f:
+                        f.write(str(i))
+                assert get_cwd() == os.path.abspath("shared")
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sorted(os.listdir("shared")) == [
+        "out{}.txt".format(i) for i in range(4)]
+    assert get_cwd() == os.getcwd()
+
+
+def test_cwd_run(cleandir):
+    os.mkdir("sub")
+    with WorkDir("sub"):
+        out = cwd_run(
+            [sys.executable, "-c", "import os; print(os.getcwd())"],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.strip()
+    assert os.path.realpath(out) == os.path.realpath("sub")
+
+
+def test_atomic_write(cleandir):
+    atomic_write("data.json", '{"a": 1}')
+    with open("data.json") as f:
+        assert f.read() == '{"a": 1}'
+    if sys.platform != "win32":
+        os.chmod("data.json", 0o640)
+    atomic_write("data.json", b"bytes", fsync=False)
+    with open("data.json", "rb") as f:
+        assert f.read() == b"bytes"
+    if sys.platform != "win32":
+        assert os.stat("data.json").st_mode & 0o777 == 0o640
+    assert os.listdir(".") == ["data.json"]
+
+
+def test_atomic_write_batch(cleandir):
+    os.mkdir("sub")
+    with AtomicWriteBatch() as batch:
+        for i in range(20):
+            batch.write(os.path.join("sub", "file{}".format(i)), str(i))
+        batch.write("top", b"top")
+        assert not os.path.exists("top")
+    assert sorted(os.listdir("sub")) == sorted(
+        "file{}".format(i) for i in range(20))
+    with open(os.path.join("sub", "file7")) as f:
+        assert f.read() == "7"
+
+    with pytest.raises(RuntimeError):
+        with AtomicWriteBatch() as batch:
+            batch.write("aborted", b"x")
+            raise RuntimeError("boom")
+    assert sorted(os.listdir(".")) == ["sub", "top"]
+
+
+def test_atomic_write_batch_read_only_target(cleandir, monkeypatch):
+    with open("ro.txt", "w") as f:
+        f.write("old")
+    os.chmod("ro.txt", 0o444)
+    fsync_file = paths._fsync_file
+
+    def checked_fsync_file(path):
+        # Opening a read only file for writing fails unless root
+        if not os.stat(path).st_mode & 0o200:
+            raise PermissionError(path)
+        fsync_file(path)
+
+    monkeypatch.setattr(paths, "_fsync_file", checked_fsync_file)
+    with AtomicWriteBatch() as batch:
+        batch.write("ro.txt", "new")
+    with open("ro.txt") as f:
+        assert f.read() == "new"
+    if sys.platform != "win32":
+        assert os.stat("ro.txt").st_mode & 0o777 == 0o444
+    assert os.listdir(".") == ["ro.txt"]
+
+
+def test_scan_tree(cleandir):
+    make_tree("tree")
+    expected = DirStats(files=52, dirs=39, bytes=520)
+    assert scan_tree("tree") == expected
+    assert scan_tree("tree", workers=4) == expected
+
+
+def test_scan_tree_cache(cleandir, monkeypatch):
+    make_tree("tree")
+    cache = {}
+    assert scan_tree("tree", cache=cache).files == 52
+
+    listed = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    assert scan_tree("tree", workers=2, cache=cache).files == 52
+    assert listed == []
+
+    sub = os.path.join("tree", "dir1")
+    with open(os.path.join(sub, "new"), "wb") as f:
+        f.write(b"12345")
+    st = os.stat(sub)
+    os.utime(sub, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert scan_tree("tree", cache=cache) == DirStats(53, 39, 525)
+    assert listed == [os.path.abspath(sub)]
+
+
+def test_copy_file(cleandir):
+    data = os.urandom(1024 * 64)
+    with open("src", "wb") as f:
+        f.write(data)
+    if sys.platform != "win32":
+        os.chmod("src", 0o640)
+    method = copy_file("src", "dst")
+    assert method in ("reflink", "copy_file_range", "sendfile", "buffered")
+    with open("dst", "rb") as f:
+        assert f.read() == data
+    if sys.platform != "win32":
+        assert os.stat("dst").st_mode & 0o777 == 0o640
+
+
+def test_copy_file_same_file(cleandir):
+    with open("src", "wb") as f:
+        f.write(b"data")
+    same = ["src"]
+    if sys.platform != "win32":
+        os.symlink("src", "link")
+        same.append("link")
+    for dst in same:
+        with pytest.raises(shutil.SameFileError):
+            copy_file("src", dst)
+    with open("src", "rb") as f:
+        assert f.read() == b"data"
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_copy_special_files(cleandir):
+    make_tree("tree", depth=1)
+    os.mkfifo(os.path.join("tree", "pipe"))
+    with pytest.raises(shutil.SpecialFileError):
+        copy_file(os.path.join("tree", "pipe"), "pipe-copy")
+    with pytest.raises(shutil.Error) as info:
+        copy_tree("tree", "copy")
+    assert [e[0] for e in info.value.args[0]] == [
+        os.path.join("tree", "pipe")]
+    assert sorted(os.listdir("copy")) == sorted(
+        n for n in os.listdir("tree") if n != "pipe")
+
+
+def test_copy_file_fallback(cleandir, monkeypatch):
+    import errno
+
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "unsupported")
+
+    monkeypatch.setattr(paths, "fcntl", None)
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(os, "sendfile", unsupported, raising=False)
+    data = os.urandom(1024 * 1024 * 3)
+    with open("src", "wb") as f:
+        f.write(data)
+    assert copy_file("src", "dst") == "buffered"
+    with open("dst", "rb") as f:
+        assert f.read() == data
+
+
+def test_copy_tree(cleandir):
+    make_tree("tree")
+    stats = copy_tree("tree", "copy", workers=4)
+    assert stats == CopyStats(files=52, dirs=39, bytes=520)
+    assert scan_tree("copy") == scan_tree("tree")
+    with pytest.raises(FileExistsError):
+        copy_tree("tree", "copy")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs symlinks")
+def test_copy_tree_symlinks(cleandir):
+    make_tree("tree", depth=1)
+    os.symlink("file0", os.path.join("tree", "link"))
+    stats = copy_tree("tree", "copy")
+    assert stats.files == 5
+    assert os.readlink(os.path.join("copy", "link")) == "file0"
+
+
+def _make_version_dir(path, version):
+    os.makedirs(path)
+    with open(os.path.join(path, "version"), "w") as f:
+        f.write(version)
+
+
+def _read_version(path):
+    with open(os.path.join(path, "version")) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("atomic", [True, False])
+def test_swap_dirs(cleandir, monkeypatch, atomic):
+    if not atomic:
+        monkeypatch.setattr(paths, "_rename_exchange", lambda a, b: False)
+    _make_version_dir("app", "1")
+    _make_version_dir("staged", "2")
+    result = swap_dirs("app", "staged")
+    if not atomic:
+        assert result is False
+    assert _read_version("app") == "2"
+    assert _read_version("staged") == "1"
+    assert sorted(os.listdir(".")) == ["app", "staged"]
+
+
+@pytest.mark.parametrize("atomic", [True, False])
+def test_replace_dir(cleandir, monkeypatch, atomic):
+    if not atomic:
+        monkeypatch.setattr(paths, "_rename_exchange", lambda a, b: False)
+    _make_version_dir("app", "1")
+    make_tree(os.path.join("app", "lib"))
+    _make_version_dir("staged", "2")
+    stats = replace_dir("app", "staged").result(timeout=10)
+    assert stats.files == 53
+    assert _read_version("app") == "2"
+    assert not os.path.exists("staged")
+    assert os.listdir(".") == ["app"]
+
+    _make_version_dir("new", "3")
+    assert replace_dir("other", "new").result() == RemoveStats(0, 0, 0, 0)
+    assert _read_version("other") == "3"
+
+
+@pytest.mark.parametrize("atomic", [True, False])
+def test_replace_dir_missing_new_path(cleandir, monkeypatch, atomic):
+    if not atomic:
+        monkeypatch.setattr(paths, "_rename_exchange", lambda a, b: False)
+    _make_version_dir("app", "1")
+    with pytest.raises(FileNotFoundError):
+        replace_dir("app", "staged-typo")
+    assert _read_version("app") == "1"
+    assert os.listdir(".") == ["app"]
+
+
+def test_find_duplicates(cleandir):
+    big = os.urandom(1024 * 64)
+    files = {
+        os.path.join("a", "big1"): big,
+        os.path.join("b", "sub", "big2"): big,
+        # Same size, ends and partial hash as big, differs in the middle
+        os.path.join("b", "big3"): big[:1000] + b"x" + big[1001:],
+        os.path.join("a", "small1"): b"small",
+        os.path.join("b", "small2"): b"small",
+        os.path.join("b", "small3"): b"smal!",
+        os.path.join("a", "empty1"): b"",
+        os.path.join("b", "empty2"): b"",
+    }
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    os.link(os.path.join("a", "big1"), os.path.join("a", "hardlink"))
+    if sys.platform != "win32":
+        os.symlink("big1", os.path.join("a", "symlink"))
+
+    groups = find_duplicates(["a", "b"], partial_size=1024, workers=4)
+    assert all(isinstance(f, DuplicateFile) for g in groups for f in g)
+    names = [[os.path.relpath(f.path) for f in group] for group in groups]
+    assert len(names) == 2
+    assert names[0][-1] == os.path.join("b", "sub", "big2")
+    assert names[0][0] in (os.path.join("a", "big1"),
+                           os.path.join("a", "hardlink"))
+    assert names[1] == [os.path.join("a", "small1"),
+                        os.path.join("b", "small2")]
+
+    assert link_duplicates(groups) == 2
+    assert os.path.samefile(names[0][0], names[0][1])
+    assert os.path.samefile(names[1][0], names[1][1])
+    with open(os.path.join("b", "small2"), "rb") as f:
+        assert f.read() == b"small"
+    assert find_duplicates(["a", "b"]) == []
+
+
+def test_link_duplicates_skips_changed(cleandir):
+    for name in ("keep", "changed", "same"):
+        with open(name, "wb") as f:
+            f.write(b"contents")
+    groups = find_duplicates(["."])
+    assert len(groups[0]) == 3
+
+    with open("changed", "wb") as f:
+        f.write(b"modified")
+    st = os.stat("changed")
+    os.utime("changed", ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert link_duplicates(groups) == 1
+    assert os.path.samefile("keep", "same")
+    with open("changed", "rb") as f:
+        assert f.read() == b"modified"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs POSIX modes")
+def test_link_duplicates_metadata(cleandir):
+    for name in ("keep", "mode", "same"):
+        with open(name, "wb") as f:
+            f.write(b"contents")
+    os.chmod("keep", 0o644)
+    os.chmod("mode", 0o755)
+    os.chmod("same", 0o644)
+    assert link_duplicates(find_duplicates(["."])) == 1
+    assert os.path.samefile("keep", "same")
+    assert not os.path.samefile("keep", "mode")
+
+    assert link_duplicates(find_duplicates(["."]), same_metadata=False) == 1
+    assert os.path.samefile("keep", "mode")
+    assert os.stat("mode").st_mode & 0o777 == 0o644